@@ -0,0 +1,83 @@
+"""Buffered user activity fields such as last_login
+
+Logins used to rewrite users.json just to bump last_login. Instead the
+new values are kept in memory and written to the user store in one batch
+once enough users are pending, after a time interval, or at shutdown.
+"""
+import atexit
+import threading
+import time
+
+from background import ProcessStarter
+
+
+class ActivityBuffer:
+    """Collect per-user field updates and flush them to the store in batches
+
+    flush_count: flush as soon as this many users have pending updates
+    flush_interval: seconds between background flushes (0 disables the timer)
+    """
+
+    def __init__(self, store, flush_interval=30, flush_count=100):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.flush_count = flush_count
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = ProcessStarter(self._start_timer)
+        atexit.register(self.flush)
+
+    def record(self, username, **fields):
+        """Buffer new field values for username"""
+        with self._lock:
+            self._pending.setdefault(username, {}).update(fields)
+            due = len(self._pending) >= self.flush_count
+        if due:
+            self.flush()
+        else:
+            self._ensure_timer()
+
+    def overlay(self, username, user_data):
+        """Apply pending field values to user_data loaded from the store"""
+        if user_data is None:
+            return None
+        with self._lock:
+            fields = self._pending.get(username)
+            if fields:
+                user_data.update(fields)
+        return user_data
+
+    def flush(self):
+        """Write all pending updates to the store in one batch"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                self.store.update_many(pending)
+            except Exception as e:
+                # Keep the updates for the next attempt unless newer ones arrived
+                with self._lock:
+                    for username, fields in pending.items():
+                        merged = dict(fields)
+                        merged.update(self._pending.get(username, {}))
+                        self._pending[username] = merged
+                print(f"Activity flush error: {e}")
+
+    def _ensure_timer(self):
+        """Start the background flusher in this process if it is not running"""
+        if self.flush_interval:
+            self._timer.ensure()
+
+    def _start_timer(self):
+        """Start the background flusher thread"""
+        thread = threading.Thread(target=self._run_timer, name='activity-flush', daemon=True)
+        thread.start()
+
+    def _run_timer(self):
+        """Flush pending updates every flush_interval seconds"""
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
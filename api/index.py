@@ -5,14 +5,26 @@ import os
 import hashlib
 import secrets
 import re
+import sys
 from datetime import datetime, timedelta
-from textblob import TextBlob
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+# Shared modules live in the project root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ids import next_entry_id
+from keys import RotatingSessionInterface, load_secret_keys
+
 app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-this')
+# Serverless instances share sessions only through SECRET_KEY, with
+# SECRET_KEY_FALLBACKS accepted during a rotation
+SECRET_KEYS = load_secret_keys(
+    os.environ.get('SECRET_KEY', 'your-secret-key-change-this'),
+    os.environ.get('SECRET_KEY_FALLBACKS', '').split(',')
+)
+app.secret_key = SECRET_KEYS[-1]
+app.session_interface = RotatingSessionInterface(SECRET_KEYS)
 CORS(app, supports_credentials=True)
 
 # File paths
@@ -41,7 +53,7 @@ def load_users():
 def save_users(users):
     """Save users to JSON file"""
     with open(USERS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(users, f, ensure_ascii=False, indent=2)
+        json.dump(users, f, ensure_ascii=False, separators=(',', ':'))
 
 def hash_password(password):
     """Hash password using SHA-256"""
@@ -71,6 +83,7 @@ def require_auth(f):
         if not get_current_user():
             return jsonify({'error': 'Authentication required'}), 401
         return f(*args, **kwargs)
+    decorated_function.__name__ = f.__name__
     return decorated_function
 
 def get_user_id():
@@ -100,11 +113,13 @@ def save_entries(entries, user_id):
     os.makedirs('journal_data', exist_ok=True)
     file_path = get_journal_file(user_id)
     with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(entries, f, ensure_ascii=False, indent=2)
+        json.dump(entries, f, ensure_ascii=False, separators=(',', ':'))
 
 def analyze_sentiment(text):
     """Analyze sentiment of text using TextBlob"""
     try:
+        # Imported here so cold starts that never analyze text skip it
+        from textblob import TextBlob
         blob = TextBlob(text)
         polarity = blob.sentiment.polarity
         
@@ -149,7 +164,7 @@ def add_entry():
         
         # Create entry
         entry = {
-            'id': len(load_entries(user_id)) + 1,
+            'id': next_entry_id(),
             'entry': entry_text,
             'mood': sentiment,
             'date': datetime.now().strftime('%Y-%m-%d'),
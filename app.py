@@ -1,15 +1,24 @@
-from flask import Flask, request, jsonify, send_from_directory, session
+from flask import Flask, request, jsonify, session
 from flask_cors import CORS
-from textblob import TextBlob
-from datetime import datetime, timedelta
-import json
+from datetime import datetime, timedelta, timezone
 import os
 import hashlib
 import secrets
 import re
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from activity import ActivityBuffer
+from assets import StaticAssets
+from ids import next_entry_id
+from keys import RotatingSessionInterface, load_secret_keys
+from mailer import MailQueue, build_message, open_connection
+from responses import FastJSONProvider, compress_response
+from search import SearchIndex
+from sessions import create_session_store
+from sentiment import analyze_sentiment, analyze_batch, sentiment_cache, preload_sentiment
+from stats import StatsStore, TREND_BUCKETS, average_mood
+from archive import JournalArchive
+from sweeper import ExpirySweeper
+from storage import CachedJournalStore, TieredJournalStore, create_journal_store, create_user_store, create_token_store
+from writebuffer import WriteBuffer
 
 # Try to import email config, fallback to default if not available
 try:
@@ -25,7 +34,20 @@ except ImportError:
     }
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)  # Generate a secure secret key
+app.json = FastJSONProvider(app)
+
+# Session cookies are signed with SECRET_KEY, which every worker and node
+# must share (see keys.py). Without it a key is generated once into
+# SECRET_KEY_FILE. SECRET_KEY_FALLBACKS lists retired keys, comma-separated,
+# that are still accepted while they are rotated out.
+SECRET_KEYS = load_secret_keys(
+    os.environ.get('SECRET_KEY'),
+    os.environ.get('SECRET_KEY_FALLBACKS', '').split(','),
+    os.environ.get('SECRET_KEY_FILE', 'secret_key.txt')
+)
+app.secret_key = SECRET_KEYS[-1]
+app.session_interface = RotatingSessionInterface(SECRET_KEYS)
+
 CORS(app, supports_credentials=True)
 
 # Directory to store journal entries for different users
@@ -33,24 +55,124 @@ JOURNAL_DIR = 'journal_data'
 USERS_FILE = 'users.json'
 VERIFICATION_TOKENS_FILE = 'verification_tokens.json'
 
+# Entries kept in the hot journal, older ones are moved to the archive
+JOURNAL_HOT_ENTRIES = int(os.environ.get('JOURNAL_HOT_ENTRIES', 50))
+JOURNAL_ARCHIVE_DIR = os.environ.get('JOURNAL_ARCHIVE_DIR', os.path.join(JOURNAL_DIR, 'archive'))
+
+# Total entries kept per user across both tiers (0 keeps the full history)
+JOURNAL_MAX_ENTRIES = int(os.environ.get('JOURNAL_MAX_ENTRIES', 0))
+
+# Parsed journals kept in memory (0 users disables the cache)
+JOURNAL_CACHE_MAX_USERS = int(os.environ.get('JOURNAL_CACHE_MAX_USERS', 256))
+JOURNAL_CACHE_MAX_BYTES = int(os.environ.get('JOURNAL_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# New entries are held this long per user and committed together (0 writes
+# each one immediately). JOURNAL_WAL=0 skips the write-ahead log that keeps
+# buffered entries safe across crashes.
+JOURNAL_WRITE_WINDOW_MS = float(os.environ.get('JOURNAL_WRITE_WINDOW_MS', 50))
+JOURNAL_WAL = os.environ.get('JOURNAL_WAL', '1') != '0'
+
+# Most results returned by GET /api/journal/search
+SEARCH_MAX_RESULTS = 100
+
+# Load TextBlob at import instead of on the first analyzed entry. Combine with
+# `gunicorn --preload` so workers inherit it from the master.
+SENTIMENT_PRELOAD = os.environ.get('SENTIMENT_PRELOAD') == '1'
+
+# Largest number of entries accepted by POST /api/journal/batch
+BATCH_MAX_ENTRIES = int(os.environ.get('BATCH_MAX_ENTRIES', 1000))
+
+# Deliver emails from a background queue (set EMAIL_ASYNC=0 to send inline)
+EMAIL_ASYNC = os.environ.get('EMAIL_ASYNC', '1') != '0'
+EMAIL_WORKERS = int(os.environ.get('EMAIL_WORKERS', 2))
+
+# Batched writes of last_login and similar activity fields
+ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 30))
+ACTIVITY_FLUSH_COUNT = int(os.environ.get('ACTIVITY_FLUSH_COUNT', 100))
+
+# gzip/brotli-compress responses of at least RESPONSE_COMPRESS_MIN_BYTES for
+# clients that accept it (RESPONSE_COMPRESSION=0 turns this off, e.g. when a
+# reverse proxy already compresses)
+RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', '1') != '0'
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', 500))
+RESPONSE_COMPRESS_LEVEL = int(os.environ.get('RESPONSE_COMPRESS_LEVEL', 6))
+
+# Seconds browsers may reuse index.html and the other pages without asking
+# (0 makes them revalidate every time, which is answered with a 304)
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 0))
+
+# Server-side login sessions: 'memory' (per worker) or 'sqlite' (shared through
+# STORAGE_DB). A session's cached profile is trusted for SESSION_TTL seconds
+# before the user store is checked again.
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'memory')
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 300))
+
+# Seconds between purges of expired verification and reset tokens (0 disables)
+TOKEN_SWEEP_INTERVAL = float(os.environ.get('TOKEN_SWEEP_INTERVAL', 600))
+
 # Create journal directory if it doesn't exist
 if not os.path.exists(JOURNAL_DIR):
     os.makedirs(JOURNAL_DIR)
 
+# Storage backends (JSON files by default, see storage.py)
+journal_store = TieredJournalStore(
+    CachedJournalStore(
+        create_journal_store(JOURNAL_DIR),
+        max_users=JOURNAL_CACHE_MAX_USERS,
+        max_bytes=JOURNAL_CACHE_MAX_BYTES
+    ),
+    JournalArchive(JOURNAL_ARCHIVE_DIR),
+    hot_entries=JOURNAL_HOT_ENTRIES,
+    max_entries=JOURNAL_MAX_ENTRIES
+)
+search_index = SearchIndex()
+user_store = create_user_store(USERS_FILE)
+token_store = create_token_store(VERIFICATION_TOKENS_FILE)
+token_sweeper = ExpirySweeper(token_store, interval=TOKEN_SWEEP_INTERVAL, name='token-sweeper')
+session_store = create_session_store(SESSION_BACKEND, ttl=SESSION_TTL)
+session_sweeper = ExpirySweeper(session_store, interval=TOKEN_SWEEP_INTERVAL, name='session-sweeper')
+static_assets = StaticAssets('.', ['index.html', 'reset-password.html'], max_age=STATIC_MAX_AGE)
+if SENTIMENT_PRELOAD:
+    preload_sentiment()
+
+mail_queue = MailQueue(EMAIL_CONFIG, workers=EMAIL_WORKERS)
+stats_store = StatsStore(JOURNAL_DIR, lambda user_id: journal_store.load(user_id))
+activity_buffer = ActivityBuffer(
+    user_store,
+    flush_interval=ACTIVITY_FLUSH_INTERVAL,
+    flush_count=ACTIVITY_FLUSH_COUNT
+)
+write_buffer = WriteBuffer(
+    lambda user_id, entries: commit_entries(entries, user_id),
+    window=JOURNAL_WRITE_WINDOW_MS / 1000,
+    wal_dir=os.path.join(JOURNAL_DIR, 'wal') if JOURNAL_WAL else None
+)
+
 def load_users():
-    """Load users from JSON file"""
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-    return {}
+    """Load all users"""
+    return user_store.load_all()
 
 def save_users(users):
-    """Save users to JSON file"""
-    with open(USERS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(users, f, ensure_ascii=False, indent=2)
+    """Replace all users"""
+    user_store.save_all(users)
+
+def get_user(username):
+    """Get a single user's data (including unflushed activity) or None"""
+    return activity_buffer.overlay(username, user_store.get(username))
+
+def put_user(username, user_data):
+    """Create or update a single user"""
+    user_store.put(username, user_data)
+    # Sessions re-read the changed user on their next request
+    session_store.invalidate_user(username)
+
+def record_user_activity(username, **fields):
+    """Update activity fields like last_login without rewriting the user store"""
+    activity_buffer.record(username, **fields)
+
+def find_username_by_email(email):
+    """Get the username registered with email, or None"""
+    return user_store.find_by_email(email)
 
 def hash_password(password):
     """Hash password using SHA-256 with salt"""
@@ -80,9 +202,67 @@ def validate_password(password):
         return False, "Password must be at least 6 characters long"
     return True, ""
 
+def password_fingerprint(user_data):
+    """Short hash of the stored password hash, kept in the session cookie
+
+    A password change alters it, which ends the user's other sessions.
+    """
+    return hashlib.sha256(user_data['password'].encode()).hexdigest()[:16]
+
+def user_profile(username, user_data):
+    """The user fields returned by login and auth status"""
+    return {
+        'username': username,
+        'email': user_data.get('email', ''),
+        'email_verified': user_data.get('email_verified', False),
+        'created_at': user_data.get('created_at'),
+        'last_login': user_data.get('last_login')
+    }
+
+def start_session(username, user_data):
+    """Log username in on this client"""
+    session['user_id'] = username
+    session['auth'] = password_fingerprint(user_data)
+    session['sid'] = session_store.create(username, user_profile(username, user_data))
+    session_sweeper.ensure_started()
+
+def end_session():
+    """Log the client out"""
+    sid = session.pop('sid', None)
+    if sid:
+        session_store.delete(sid)
+    session.pop('user_id', None)
+    session.pop('auth', None)
+
+def get_session_profile():
+    """Get the logged-in user's profile, None if nobody is logged in
+
+    Served from the session store; the user store is only read when this
+    worker has no live record for the session (expired, invalidated, or
+    created by another worker).
+    """
+    username = session.get('user_id')
+    if not username:
+        return None
+    sid = session.get('sid')
+    record = session_store.get(sid) if sid else None
+    if record is not None and record['username'] == username:
+        return record['profile']
+    
+    # Revalidate: the user must still exist with the same password
+    user_data = get_user(username)
+    if user_data is None or session.get('auth') != password_fingerprint(user_data):
+        end_session()
+        return None
+    profile = user_profile(username, user_data)
+    session['sid'] = session_store.create(username, profile, sid=sid)
+    session_sweeper.ensure_started()
+    return profile
+
 def get_current_user():
     """Get current logged in user from session"""
-    return session.get('user_id')
+    profile = get_session_profile()
+    return profile['username'] if profile else None
 
 def require_auth(f):
     """Decorator to require authentication"""
@@ -112,51 +292,154 @@ def get_user_id():
     unique_string = f"{ip}_{user_agent}"
     return f"anonymous_{hashlib.md5(unique_string.encode()).hexdigest()[:8]}"
 
-def get_journal_file(user_id):
-    """Get journal file path for specific user"""
-    return os.path.join(JOURNAL_DIR, f'journal_{user_id}.json')
-
 def load_entries(user_id):
-    """Load journal entries from JSON file for specific user"""
-    journal_file = get_journal_file(user_id)
-    if os.path.exists(journal_file):
-        try:
-            with open(journal_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return []
-    return []
+    """Load all journal entries (hot and archived) for specific user, newest first"""
+    write_buffer.flush(user_id)
+    return journal_store.load(user_id)
+
+def query_entries(user_id, before=None, date_from=None, date_to=None, limit=None):
+    """Get a page of journal entries, newest first, None if before is unknown"""
+    write_buffer.flush(user_id)
+    return journal_store.query(user_id, before=before, date_from=date_from, date_to=date_to, limit=limit)
 
 def save_entries(entries, user_id):
-    """Save journal entries to JSON file for specific user"""
-    journal_file = get_journal_file(user_id)
-    with open(journal_file, 'w', encoding='utf-8') as f:
-        json.dump(entries, f, ensure_ascii=False, indent=2)
-
-def analyze_sentiment(text):
-    """Analyze sentiment using TextBlob with improved thresholds and crisis detection"""
-    blob = TextBlob(text)
-    polarity = blob.sentiment.polarity
-    
-    # Check for serious negative thoughts first
-    serious_negative_words = [
-        'suicide', 'kill myself', 'end my life', 'want to die', 'better off dead',
-        'no reason to live', 'give up', 'can\'t take it anymore', 'hopeless',
-        'worthless', 'burden', 'everyone would be better off', 'no point'
-    ]
-    
-    text_lower = text.lower()
-    for word in serious_negative_words:
-        if word in text_lower:
-            return 'Crisis'  # Special category for serious thoughts
-    
-    # More sensitive thresholds for better detection
-    if polarity > 0.05:  # Lowered from 0.1
-        return 'Positive'
-    elif polarity < -0.05:  # Raised from -0.1
-        return 'Negative'
-    else:
-        return 'Neutral'
+    """Replace all journal entries for specific user"""
+    write_buffer.flush(user_id)
+    with stats_store.lock(user_id):
+        journal_store.save(user_id, entries)
+        # Also bumps the journal revision behind the ETag
+        stats_store.rebuild(user_id)
+        search_index.rebuild(user_id, entries)
+
+def append_entry(entry, user_id):
+    """Add a single journal entry without rewriting the journal
+
+    With JOURNAL_WRITE_WINDOW_MS the entry is buffered and committed
+    together with the user's other new entries.
+    """
+    if JOURNAL_WRITE_WINDOW_MS > 0:
+        write_buffer.put(user_id, entry)
+        return
+    # One lock per user keeps the journal, stats and search index in step
+    # across worker processes
+    with stats_store.lock(user_id):
+        pruned = journal_store.append(user_id, entry)
+        update_stats(user_id, added=[entry], removed=pruned)
+        search_index.update(user_id, added=[entry], removed=pruned)
+
+def put_entries(entries, user_id, replaced=()):
+    """Add or replace several journal entries (oldest first) in one write
+
+    replaced lists the previous versions of entries that were overwritten.
+    """
+    write_buffer.flush(user_id)
+    store_entries(entries, user_id, replaced)
+
+def store_entries(entries, user_id, replaced=()):
+    """Write entries (oldest first) with the stats and search index, without flushing the buffer"""
+    with stats_store.lock(user_id):
+        pruned = journal_store.put_many(user_id, entries)
+        update_stats(user_id, added=entries, removed=list(replaced) + pruned)
+        search_index.update(user_id, added=entries, removed=pruned)
+
+def commit_entries(entries, user_id):
+    """Store buffered new entries (oldest first) with one journal write
+
+    Entries replayed from a write-ahead log may already be stored, those
+    replace their stored copy. Entries buffered while this batch commits
+    stay pending, so they are written after it.
+    """
+    with stats_store.lock(user_id):
+        stored = journal_store.get_many(user_id, [entry['id'] for entry in entries])
+        store_entries(entries, user_id, replaced=stored.values())
+
+def remove_entry(entry_id, user_id):
+    """Delete a single journal entry, returns the removed entry or None"""
+    # An entry deleted while still buffered is never written at all
+    pending = write_buffer.discard(user_id, entry_id)
+    if pending is not None:
+        return pending
+    write_buffer.flush(user_id)
+    with stats_store.lock(user_id):
+        removed = journal_store.delete(user_id, entry_id)
+        if removed is not None:
+            update_stats(user_id, removed=[removed])
+            search_index.update(user_id, removed=[removed])
+    return removed
+
+def get_journal_stats(user_id):
+    """Get precomputed mood counts, mood sum and first/last dates for user"""
+    write_buffer.flush(user_id)
+    return stats_store.get(user_id)
+
+def get_entry(entry_id, user_id):
+    """Get a single journal entry by id, None if it does not exist"""
+    write_buffer.flush(user_id)
+    return journal_store.get(user_id, entry_id)
+
+def get_entries_by_id(entry_ids, user_id):
+    """Get journal entries by id from the hot journal or the archive"""
+    write_buffer.flush(user_id)
+    return journal_store.get_many(user_id, entry_ids)
+
+def search_entries(query, user_id, limit=20):
+    """Full-text search, returns [(entry, score)] best match first"""
+    write_buffer.flush(user_id)
+    if not search_index.is_indexed(user_id):
+        # Writers skip unindexed users, so check again and index the journal
+        # under their lock, or entries written meanwhile would be missed
+        with stats_store.lock(user_id):
+            if not search_index.is_indexed(user_id):
+                search_index.rebuild(user_id, journal_store.load(user_id))
+    hits = search_index.search(user_id, query, limit=limit)
+    entries = get_entries_by_id([entry_id for entry_id, _ in hits], user_id)
+    return [(entries[entry_id], score) for entry_id, score in hits if entry_id in entries]
+
+def journal_validators(user_id, stats):
+    """Get the ETag and Last-Modified of a user's journal from its stats
+
+    Every journal write bumps the revision in the stats file, so this never
+    has to look at the entries themselves.
+    """
+    version = f"{user_id}:{stats.get('revision', 0)}:{stats.get('updated_at', 0)}"
+    etag = hashlib.md5(version.encode()).hexdigest()[:16]
+    updated_at = stats.get('updated_at')
+    last_modified = datetime.fromtimestamp(int(updated_at), timezone.utc) if updated_at else None
+    return etag, last_modified
+
+def is_not_modified(etag, last_modified):
+    """Check the request's If-None-Match / If-Modified-Since against the journal"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+def with_validators(response, etag, last_modified):
+    """Add ETag and Last-Modified and make browsers revalidate before reuse"""
+    # Weak because the body may be sent compressed or not
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag, last_modified):
+    """Empty 304 response for a journal that has not changed"""
+    return with_validators(app.response_class(status=304), etag, last_modified)
+
+def update_stats(user_id, added=(), removed=()):
+    """Keep the user's precomputed stats in step with a journal write"""
+    stats_store.update(user_id, added=added, removed=removed)
+
+# Moods picked in the UI mapped to sentiment labels
+MOOD_LABELS = {
+    'happy': 'Positive',
+    'smile': 'Positive',
+    'neutral': 'Neutral',
+    'sad': 'Negative',
+    'angry': 'Negative',
+}
 
 def get_suggestion(mood):
     """Get personalized suggestion based on mood with crisis support"""
@@ -207,6 +490,18 @@ def get_suggestion(mood):
     
     return random.choice(suggestions.get(mood, ["Reflect on your day and see what insights you can gain."]))
 
+@app.after_request
+def compress_output(response):
+    """Compress the response according to the client's Accept-Encoding"""
+    if RESPONSE_COMPRESSION:
+        response = compress_response(
+            response,
+            request.accept_encodings,
+            min_size=RESPONSE_COMPRESS_MIN_BYTES,
+            level=RESPONSE_COMPRESS_LEVEL
+        )
+    return response
+
 @app.route('/api/journal', methods=['POST'])
 def add_entry():
     """Add a new journal entry"""
@@ -220,20 +515,14 @@ def add_entry():
         
         # Use provided mood if present, else analyze sentiment
         if mood:
-            mood_label = {
-                'happy': 'Positive',
-                'smile': 'Positive',
-                'neutral': 'Neutral',
-                'sad': 'Negative',
-                'angry': 'Negative',
-            }.get(mood, mood)
+            mood_label = MOOD_LABELS.get(mood, mood)
         else:
             mood_label = analyze_sentiment(entry_text)
         suggestion = get_suggestion(mood_label)
         
         # Create entry
         entry = {
-            'id': int(datetime.now().timestamp() * 1000),  # Unique ID
+            'id': next_entry_id(),  # Unique ID
             'date': datetime.now().strftime('%Y-%m-%d'),
             'time': datetime.now().strftime('%H:%M:%S'),
             'entry': entry_text,
@@ -241,16 +530,10 @@ def add_entry():
             'suggestion': suggestion
         }
         
-        # Load existing entries and add new one
+        # Append to the user's journal (older entries beyond
+        # JOURNAL_HOT_ENTRIES are moved to the archive)
         user_id = get_user_id()
-        entries = load_entries(user_id)
-        entries.insert(0, entry)  # Add to beginning
-        
-        # Keep only last 50 entries to prevent file from getting too large
-        entries = entries[:50]
-        
-        # Save to file
-        save_entries(entries, user_id)
+        append_entry(entry, user_id)
         
         return jsonify({
             'success': True,
@@ -261,21 +544,218 @@ def add_entry():
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@app.route('/api/journal/batch', methods=['POST'])
+def add_entries_batch():
+    """Add (or re-score) many journal entries in one request
+
+    Body: {"entries": [{"entry": "...", "mood": "", "date": "", "time": "", "id": 0}, ...]}
+    oldest first. mood, date (YYYY-MM-DD), time (HH:MM:SS) and id are
+    optional; id must be an existing entry, which is re-scored in place.
+    """
+    try:
+        data = request.get_json()
+        items = data.get('entries') if isinstance(data, dict) else None
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'A non-empty entries list is required'}), 400
+        
+        if len(items) > BATCH_MAX_ENTRIES:
+            return jsonify({'error': f'At most {BATCH_MAX_ENTRIES} entries per batch'}), 400
+        
+        texts = []
+        moods = []
+        entry_ids = []
+        for item in items:
+            entry_text = str(item.get('entry', '')).strip() if isinstance(item, dict) else ''
+            if not entry_text:
+                return jsonify({'error': 'Entry text is required for every entry'}), 400
+            entry_id = item.get('id')
+            if entry_id is not None:
+                if not isinstance(entry_id, int) or isinstance(entry_id, bool):
+                    return jsonify({'error': 'Entry ids must be integers'}), 400
+                if entry_id in entry_ids:
+                    return jsonify({'error': f'Entry {entry_id} appears more than once'}), 400
+                entry_ids.append(entry_id)
+            for field, fmt in (('date', '%Y-%m-%d'), ('time', '%H:%M:%S')):
+                if item.get(field):
+                    try:
+                        datetime.strptime(item[field], fmt)
+                    except (TypeError, ValueError):
+                        return jsonify({'error': 'date and time must be in YYYY-MM-DD and HH:MM:SS format'}), 400
+            texts.append(entry_text)
+            moods.append(str(item.get('mood', '')).strip())
+        
+        # Re-scored entries keep their original date and time
+        user_id = get_user_id()
+        existing = get_entries_by_id(entry_ids, user_id)
+        missing = [entry_id for entry_id in entry_ids if entry_id not in existing]
+        if missing:
+            return jsonify({'error': f'Entry {missing[0]} not found'}), 404
+        
+        # Score every entry without a provided mood in one pass
+        to_score = [i for i, mood in enumerate(moods) if not mood]
+        scored = dict(zip(to_score, analyze_batch([texts[i] for i in to_score])))
+        
+        now = datetime.now()
+        entries = []
+        for i, item in enumerate(items):
+            mood = moods[i]
+            mood_label = MOOD_LABELS.get(mood, mood) if mood else scored[i]
+            original = existing.get(item.get('id'), {})
+            entries.append({
+                'id': item.get('id') if item.get('id') is not None else next_entry_id(),
+                'date': item.get('date') or original.get('date') or now.strftime('%Y-%m-%d'),
+                'time': item.get('time') or original.get('time') or now.strftime('%H:%M:%S'),
+                'entry': texts[i],
+                'mood': mood if mood else mood_label,
+                'suggestion': get_suggestion(mood_label)
+            })
+        
+        # Persist the whole batch with a single storage write
+        replaced = [existing[entry['id']] for entry in entries if entry['id'] in existing]
+        put_entries(entries, user_id, replaced=replaced)
+        
+        return jsonify({
+            'success': True,
+            'entries': entries,
+            'count': len(entries),
+            'message': 'Entries added successfully'
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
 @app.route('/api/journal', methods=['GET'])
 def get_entries():
-    """Get all journal entries (or last N entries)"""
+    """Get journal entries, newest first, one page at a time
+
+    ?limit=N (default 7), ?before=<id> to continue after the last entry of
+    the previous page, ?from=YYYY-MM-DD&to=YYYY-MM-DD to filter by date.
+    """
     try:
         user_id = get_user_id()
-        entries = load_entries(user_id)
         
         # Get limit from query parameter (default 7)
-        limit = request.args.get('limit', 7, type=int)
-        entries = entries[:limit]
+        limit = max(request.args.get('limit', 7, type=int), 0)
+        before = request.args.get('before', type=int)
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        
+        for value in (date_from, date_to):
+            if value:
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    return jsonify({'error': 'from and to must be dates in YYYY-MM-DD format'}), 400
+        
+        # Answer unchanged journals from the stats file alone
+        etag, last_modified = journal_validators(user_id, get_journal_stats(user_id))
+        if is_not_modified(etag, last_modified):
+            return not_modified(etag, last_modified)
+        
+        entries = query_entries(user_id, before=before, date_from=date_from, date_to=date_to, limit=limit)
+        if entries is None:
+            return jsonify({'error': 'before must be the id of an existing entry'}), 400
+        
+        return with_validators(jsonify({
+            'success': True,
+            'entries': entries,
+            'count': len(entries),
+            # Pass as ?before= to get the next page, None once there are no more
+            'next_before': entries[-1]['id'] if entries and len(entries) == limit else None
+        }), etag, last_modified)
+        
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/journal/search', methods=['GET'])
+def search_journal():
+    """Search journal entries by text
+
+    ?q= takes words (all must match), "quoted phrases" and word* prefixes.
+    Results are ranked best match first; ?limit=N (default 20).
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        limit = min(max(request.args.get('limit', 20, type=int), 0), SEARCH_MAX_RESULTS)
+        
+        if not query:
+            return jsonify({'error': 'Search query (q) is required'}), 400
+        
+        user_id = get_user_id()
+        results = search_entries(query, user_id, limit=limit)
         
         return jsonify({
             'success': True,
-            'entries': entries,
-            'count': len(entries)
+            'query': query,
+            'entries': [dict(entry, score=score) for entry, score in results],
+            'count': len(results)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/journal/<int:entry_id>', methods=['GET'])
+def get_entry_by_id(entry_id):
+    """Get a specific journal entry"""
+    try:
+        user_id = get_user_id()
+        entry = get_entry(entry_id, user_id)
+        
+        if entry is None:
+            return jsonify({'error': 'Entry not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'entry': entry
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/journal/<int:entry_id>', methods=['PATCH'])
+def update_entry(entry_id):
+    """Edit the text and/or mood of a specific journal entry
+
+    Body: {"entry": "...", "mood": "..."}, both optional. Changed text
+    without a mood is analyzed again; date, time and id are kept.
+    """
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict) or ('entry' not in data and 'mood' not in data):
+            return jsonify({'error': 'entry or mood is required'}), 400
+        
+        entry_text = str(data.get('entry', '')).strip()
+        mood = str(data.get('mood', '')).strip()
+        
+        if 'entry' in data and not entry_text:
+            return jsonify({'error': 'Entry text cannot be empty'}), 400
+        
+        user_id = get_user_id()
+        original = get_entry(entry_id, user_id)
+        if original is None:
+            return jsonify({'error': 'Entry not found'}), 404
+        
+        entry = dict(original)
+        if entry_text:
+            entry['entry'] = entry_text
+        if mood:
+            mood_label = MOOD_LABELS.get(mood, mood)
+            entry['mood'] = mood
+        elif entry_text:
+            mood_label = analyze_sentiment(entry_text)
+            entry['mood'] = mood_label
+        else:
+            mood_label = MOOD_LABELS.get(entry.get('mood'), entry.get('mood'))
+        if entry.get('mood') != original.get('mood'):
+            entry['suggestion'] = get_suggestion(mood_label)
+        
+        put_entries([entry], user_id, replaced=[original])
+        
+        return jsonify({
+            'success': True,
+            'entry': entry,
+            'message': 'Entry updated successfully'
         })
         
     except Exception as e:
@@ -286,17 +766,11 @@ def delete_entry(entry_id):
     """Delete a specific journal entry"""
     try:
         user_id = get_user_id()
-        entries = load_entries(user_id)
         
         # Find and remove entry
-        original_count = len(entries)
-        entries = [entry for entry in entries if entry.get('id') != entry_id]
-        
-        if len(entries) == original_count:
+        if not remove_entry(entry_id, user_id):
             return jsonify({'error': 'Entry not found'}), 404
         
-        save_entries(entries, user_id)
-        
         return jsonify({
             'success': True,
             'message': 'Entry deleted successfully'
@@ -310,15 +784,18 @@ def get_user_info():
     """Get current user/device information"""
     try:
         user_id = get_user_id()
-        entries = load_entries(user_id)
+        stats = get_journal_stats(user_id)
+        etag, last_modified = journal_validators(user_id, stats)
+        if is_not_modified(etag, last_modified):
+            return not_modified(etag, last_modified)
         
-        return jsonify({
+        return with_validators(jsonify({
             'success': True,
             'user_id': user_id,
-            'total_entries': len(entries),
-            'first_entry_date': entries[-1]['date'] if entries else None,
-            'last_entry_date': entries[0]['date'] if entries else None
-        })
+            'total_entries': stats['total_entries'],
+            'first_entry_date': stats['first_entry_date'],
+            'last_entry_date': stats['last_entry_date']
+        }), etag, last_modified)
         
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
@@ -328,45 +805,66 @@ def get_stats():
     """Get journal statistics for current user"""
     try:
         user_id = get_user_id()
-        entries = load_entries(user_id)
+        stats = get_journal_stats(user_id)
+        etag, last_modified = journal_validators(user_id, stats)
+        if is_not_modified(etag, last_modified):
+            return not_modified(etag, last_modified)
         
-        if not entries:
-            return jsonify({
-                'success': True,
-                'user_id': user_id,
-                'stats': {
-                    'total_entries': 0,
-                    'mood_distribution': {},
-                    'average_mood': 'No data'
-                }
-            })
+        return with_validators(jsonify({
+            'success': True,
+            'user_id': user_id,
+            'stats': {
+                'total_entries': stats['total_entries'],
+                'mood_distribution': stats['mood_counts'],
+                'average_mood': average_mood(stats)
+            }
+        }), etag, last_modified)
         
-        # Count mood distribution
-        mood_counts = {}
-        for entry in entries:
-            mood = entry.get('mood', 'Unknown')
-            mood_counts[mood] = mood_counts.get(mood, 0) + 1
-        
-        # Calculate average mood
-        mood_values = {'Positive': 1, 'Neutral': 0, 'Negative': -1}
-        total_mood_value = sum(mood_values.get(entry.get('mood', 'Neutral'), 0) for entry in entries)
-        avg_mood_value = total_mood_value / len(entries)
-        
-        if avg_mood_value > 0.3:
-            average_mood = 'Positive'
-        elif avg_mood_value < -0.3:
-            average_mood = 'Negative'
-        else:
-            average_mood = 'Neutral'
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/stats/trend', methods=['GET'])
+def get_stats_trend():
+    """Get mood counts and average mood per day, week or month"""
+    try:
+        bucket = request.args.get('bucket', 'day')
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        
+        if bucket not in TREND_BUCKETS:
+            return jsonify({'error': f'bucket must be one of: {", ".join(TREND_BUCKETS)}'}), 400
+        
+        for value in (date_from, date_to):
+            if value:
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    return jsonify({'error': 'from and to must be dates in YYYY-MM-DD format'}), 400
+        
+        user_id = get_user_id()
+        write_buffer.flush(user_id)
         
         return jsonify({
             'success': True,
             'user_id': user_id,
-            'stats': {
-                'total_entries': len(entries),
-                'mood_distribution': mood_counts,
-                'average_mood': average_mood
-            }
+            'bucket': bucket,
+            'trend': stats_store.trend(user_id, bucket, date_from, date_to)
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Get cache hit/miss counters for this worker process"""
+    try:
+        return jsonify({
+            'success': True,
+            'pid': os.getpid(),
+            'journal_cache': journal_store.stats(),
+            'tokens_purged': token_sweeper.purged,
+            'write_buffer': write_buffer.stats(),
+            'sentiment_cache': sentiment_cache.stats()
         })
         
     except Exception as e:
@@ -375,17 +873,15 @@ def get_stats():
 @app.route('/index.html')
 def serve_index():
     """Serve the main journal app"""
-    return send_from_directory('.', 'index.html')
+    return static_assets.serve('index.html', request)
 
 @app.route('/reset-password.html')
 def serve_reset_password():
     """Serve the password reset page"""
-    return send_from_directory('.', 'reset-password.html')
+    return static_assets.serve('reset-password.html', request)
 
-@app.route('/')
-def home():
-    """Serve the main page"""
-    return '''
+# API landing page, compressed once and then served from memory
+HOME_PAGE = '''
     <!DOCTYPE html>
     <html>
     <head>
@@ -445,10 +941,33 @@ def home():
                 <code>{"entry": "Your journal text here"}</code>
             </div>
             
+            <div class="endpoint">
+                <h3>POST /api/journal/batch</h3>
+                <p>Add or re-score many entries at once (oldest first)</p>
+                <code>{"entries": [{"entry": "Day one", "date": "2024-01-01"}, {"entry": "Day two"}]}</code>
+            </div>
+            
             <div class="endpoint">
                 <h3>GET /api/journal</h3>
                 <p>Get all journal entries for the logged-in user</p>
-                <code>Optional: ?limit=7</code>
+                <code>Optional: ?limit=7&amp;before=&lt;id&gt;&amp;from=YYYY-MM-DD&amp;to=YYYY-MM-DD</code>
+            </div>
+            
+            <div class="endpoint">
+                <h3>GET /api/journal/search</h3>
+                <p>Search entries by words, "quoted phrases" and prefix* terms</p>
+                <code>Required: ?q=...  Optional: &amp;limit=20</code>
+            </div>
+            
+            <div class="endpoint">
+                <h3>GET /api/journal/&lt;id&gt;</h3>
+                <p>Get a specific entry</p>
+            </div>
+            
+            <div class="endpoint">
+                <h3>PATCH /api/journal/&lt;id&gt;</h3>
+                <p>Edit an entry's text and/or mood</p>
+                <code>{"entry": "...", "mood": "..."}</code>
             </div>
             
             <div class="endpoint">
@@ -461,6 +980,12 @@ def home():
                 <p>Get journal statistics for the logged-in user</p>
             </div>
             
+            <div class="endpoint">
+                <h3>GET /api/stats/trend</h3>
+                <p>Get mood counts and average mood per day, week or month</p>
+                <code>Optional: ?bucket=day|week|month&amp;from=YYYY-MM-DD&amp;to=YYYY-MM-DD</code>
+            </div>
+            
             <div class="endpoint">
                 <h3>GET /api/user-info</h3>
                 <p>Get user information and entry summary</p>
@@ -482,6 +1007,12 @@ def home():
     </body>
     </html>
     '''
+static_assets.add_text('home.html', HOME_PAGE)
+
+@app.route('/')
+def home():
+    """Serve the main page"""
+    return static_assets.serve('home.html', request)
 
 @app.route('/api/auth/register', methods=['POST'])
 def register():
@@ -510,33 +1041,27 @@ def register():
         if not validate_email(email):
             return jsonify({'error': 'Invalid email format'}), 400
         
-        # Load existing users
-        users = load_users()
-        
         # Check if username already exists
-        if username in users:
+        if get_user(username) is not None:
             return jsonify({'error': 'Username already exists'}), 409
         
         # Check if email already exists
-        for user_data in users.values():
-            if user_data.get('email') == email:
-                return jsonify({'error': 'Email already registered'}), 409
+        if find_username_by_email(email):
+            return jsonify({'error': 'Email already registered'}), 409
         
         # Hash password and create user (no verification)
         hashed_password = hash_password(password)
-        users[username] = {
+        user_data = {
             'password': hashed_password,
             'email': email,
             'email_verified': True,  # Always true now
             'created_at': datetime.now().isoformat(),
             'last_login': None
         }
-        
-        # Save users
-        save_users(users)
+        put_user(username, user_data)
         
         # Log in the user immediately
-        session['user_id'] = username
+        start_session(username, user_data)
         
         return jsonify({
             'success': True,
@@ -559,30 +1084,26 @@ def verify_email():
         if not token:
             return jsonify({'error': 'Verification token is required'}), 400
         
-        tokens = load_verification_tokens()
-        if token not in tokens:
+        token_data = get_verification_token(token)
+        if token_data is None:
             return jsonify({'error': 'Invalid or expired verification token'}), 400
         
-        token_data = tokens[token]
-        
         # Check if token is expired
         expires_at = datetime.fromisoformat(token_data['expires_at'])
         if datetime.now() > expires_at:
-            del tokens[token]
-            save_verification_tokens(tokens)
+            delete_verification_token(token)
             return jsonify({'error': 'Verification token has expired'}), 400
         
         # Verify email
-        users = load_users()
         username = token_data['username']
+        user_data = get_user(username)
         
-        if username in users:
-            users[username]['email_verified'] = True
-            save_users(users)
+        if user_data is not None:
+            user_data['email_verified'] = True
+            put_user(username, user_data)
         
         # Remove used token
-        del tokens[token]
-        save_verification_tokens(tokens)
+        delete_verification_token(token)
         
         return jsonify({
             'success': True,
@@ -606,12 +1127,7 @@ def forgot_password():
             return jsonify({'error': 'Invalid email format'}), 400
         
         # Find user by email
-        users = load_users()
-        username = None
-        for uname, user_data in users.items():
-            if user_data.get('email') == email:
-                username = uname
-                break
+        username = find_username_by_email(email)
         
         if not username:
             # Don't reveal if email exists or not for security
@@ -622,15 +1138,13 @@ def forgot_password():
         
         # Generate reset token
         token = generate_verification_token()
-        tokens = load_verification_tokens()
-        tokens[token] = {
+        put_verification_token(token, {
             'username': username,
             'email': email,
             'type': 'password_reset',
             'created_at': datetime.now().isoformat(),
             'expires_at': (datetime.now() + timedelta(hours=1)).isoformat()
-        }
-        save_verification_tokens(tokens)
+        })
         
         # Send reset email
         subject, html_content, text_content = create_verification_email(email, token, 'password_reset')
@@ -666,17 +1180,14 @@ def reset_password():
         if not is_valid:
             return jsonify({'error': error_msg}), 400
         
-        tokens = load_verification_tokens()
-        if token not in tokens:
+        token_data = get_verification_token(token)
+        if token_data is None:
             return jsonify({'error': 'Invalid or expired reset token'}), 400
         
-        token_data = tokens[token]
-        
         # Check if token is expired
         expires_at = datetime.fromisoformat(token_data['expires_at'])
         if datetime.now() > expires_at:
-            del tokens[token]
-            save_verification_tokens(tokens)
+            delete_verification_token(token)
             return jsonify({'error': 'Reset token has expired'}), 400
         
         # Check token type
@@ -684,16 +1195,15 @@ def reset_password():
             return jsonify({'error': 'Invalid token type'}), 400
         
         # Update password
-        users = load_users()
         username = token_data['username']
+        user_data = get_user(username)
         
-        if username in users:
-            users[username]['password'] = hash_password(new_password)
-            save_users(users)
+        if user_data is not None:
+            user_data['password'] = hash_password(new_password)
+            put_user(username, user_data)
         
         # Remove used token
-        del tokens[token]
-        save_verification_tokens(tokens)
+        delete_verification_token(token)
         
         return jsonify({
             'success': True,
@@ -717,31 +1227,25 @@ def resend_verification():
             return jsonify({'error': 'Invalid email format'}), 400
         
         # Find user by email
-        users = load_users()
-        username = None
-        for uname, user_data in users.items():
-            if user_data.get('email') == email:
-                username = uname
-                break
+        username = find_username_by_email(email)
+        user_data = get_user(username) if username else None
         
-        if not username:
+        if user_data is None:
             return jsonify({'error': 'No account found with this email'}), 404
         
         # Check if already verified
-        if users[username].get('email_verified', False):
+        if user_data.get('email_verified', False):
             return jsonify({'error': 'Email is already verified'}), 400
         
         # Generate new verification token
         token = generate_verification_token()
-        tokens = load_verification_tokens()
-        tokens[token] = {
+        put_verification_token(token, {
             'username': username,
             'email': email,
             'type': 'email_verification',
             'created_at': datetime.now().isoformat(),
             'expires_at': (datetime.now() + timedelta(hours=24)).isoformat()
-        }
-        save_verification_tokens(tokens)
+        })
         
         # Send verification email
         subject, html_content, text_content = create_verification_email(email, token, 'email_verification')
@@ -772,34 +1276,34 @@ def login():
         if not username or not password:
             return jsonify({'error': 'Username and password are required'}), 400
         
-        # Load users
-        users = load_users()
+        # Load user
+        user_data = get_user(username)
         
         # Check if user exists
-        if username not in users:
+        if user_data is None:
             return jsonify({'error': 'Invalid username or password'}), 401
         
         # No email verification check
         # Verify password
-        if not verify_password(password, users[username]['password']):
+        if not verify_password(password, user_data['password']):
             return jsonify({'error': 'Invalid username or password'}), 401
         
-        # Update last login
-        users[username]['last_login'] = datetime.now().isoformat()
-        save_users(users)
+        # Update last login (buffered, flushed to the user store in batches)
+        user_data['last_login'] = datetime.now().isoformat()
+        record_user_activity(username, last_login=user_data['last_login'])
         
         # Log in the user
-        session['user_id'] = username
+        start_session(username, user_data)
         
         return jsonify({
             'success': True,
             'message': 'Login successful',
             'user': {
                 'username': username,
-                'email': users[username].get('email', ''),
+                'email': user_data.get('email', ''),
                 'email_verified': True,
-                'created_at': users[username]['created_at'],
-                'last_login': users[username]['last_login']
+                'created_at': user_data['created_at'],
+                'last_login': user_data['last_login']
             }
         })
         
@@ -810,7 +1314,7 @@ def login():
 def logout():
     """Logout user"""
     try:
-        session.pop('user_id', None)
+        end_session()
         return jsonify({
             'success': True,
             'message': 'Logout successful'
@@ -822,17 +1326,9 @@ def logout():
 def auth_status():
     """Check authentication status"""
     try:
-        user_id = get_current_user()
-        if not user_id:
-            return jsonify({
-                'authenticated': False,
-                'user': None
-            })
-        
-        # Load user info
-        users = load_users()
-        if user_id not in users:
-            session.pop('user_id', None)
+        # Cached per session, so this does not read the user store
+        profile = get_session_profile()
+        if profile is None:
             return jsonify({
                 'authenticated': False,
                 'user': None
@@ -840,13 +1336,7 @@ def auth_status():
         
         return jsonify({
             'authenticated': True,
-            'user': {
-                'username': user_id,
-                'email': users[user_id].get('email', ''),
-                'email_verified': users[user_id].get('email_verified', False),
-                'created_at': users[user_id]['created_at'],
-                'last_login': users[user_id]['last_login']
-            }
+            'user': profile
         })
         
     except Exception as e:
@@ -870,15 +1360,16 @@ def change_password():
             return jsonify({'error': error_msg}), 400
         
         user_id = get_current_user()
-        users = load_users()
+        user_data = get_user(user_id)
         
         # Verify current password
-        if not verify_password(current_password, users[user_id]['password']):
+        if not verify_password(current_password, user_data['password']):
             return jsonify({'error': 'Current password is incorrect'}), 401
         
-        # Update password
-        users[user_id]['password'] = hash_password(new_password)
-        save_users(users)
+        # Update password (this ends the user's other sessions)
+        user_data['password'] = hash_password(new_password)
+        put_user(user_id, user_data)
+        start_session(user_id, user_data)
         
         return jsonify({
             'success': True,
@@ -888,36 +1379,27 @@ def change_password():
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
-def load_verification_tokens():
-    """Load verification tokens from JSON file"""
-    if os.path.exists(VERIFICATION_TOKENS_FILE):
-        try:
-            with open(VERIFICATION_TOKENS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-    return {}
-
-def save_verification_tokens(tokens):
-    """Save verification tokens to JSON file"""
-    with open(VERIFICATION_TOKENS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(tokens, f, ensure_ascii=False, indent=2)
+def get_verification_token(token):
+    """Get a single token's data or None"""
+    token_sweeper.ensure_started()
+    return token_store.get(token)
+
+def put_verification_token(token, token_data):
+    """Store a single token"""
+    token_sweeper.ensure_started()
+    token_store.put(token, token_data)
+
+def delete_verification_token(token):
+    """Remove a single token"""
+    token_store.delete(token)
 
 def send_email(to_email, subject, html_content, text_content=None):
-    """Send email using SMTP"""
+    """Send email using SMTP (queued for background delivery unless EMAIL_ASYNC=0)"""
     try:
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = EMAIL_CONFIG['sender_email']
-        msg['To'] = to_email
-        if text_content:
-            text_part = MIMEText(text_content, 'plain')
-            msg.attach(text_part)
-        html_part = MIMEText(html_content, 'html')
-        msg.attach(html_part)
-        with smtplib.SMTP(EMAIL_CONFIG['smtp_server'], EMAIL_CONFIG['smtp_port']) as server:
-            server.starttls()
-            server.login(EMAIL_CONFIG['sender_email'], EMAIL_CONFIG['sender_password'])
+        if EMAIL_ASYNC:
+            return mail_queue.enqueue(to_email, subject, html_content, text_content)
+        msg = build_message(EMAIL_CONFIG, to_email, subject, html_content, text_content)
+        with open_connection(EMAIL_CONFIG) as server:
             server.send_message(msg)
         return True
     except Exception as e:
@@ -995,6 +1477,13 @@ def validate_email(email):
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute precomputed stats for every journal"""
+    for user_id in journal_store.list_users():
+        stats = stats_store.rebuild(user_id)
+        print(f"{user_id}: {stats['total_entries']} entries")
+
 if __name__ == '__main__':
     print("🚀 Starting Personal Daily Journal API...")
     print("📖 Open http://localhost:5000 in your browser")
@@ -0,0 +1,315 @@
+"""Compressed, date-partitioned archive tier for journal entries
+
+Entries that roll out of a user's hot journal are appended to
+archive/<user_id>/<YYYY-MM>.jsonl.gz, one gzip member per rollover, oldest
+first. An append writes the old members plus the new one to a temp file
+that replaces the segment, so a crash never leaves a truncated member.
+manifest.json records the entry count and id range of every segment, so
+lookups by id only open the segments that can hold the id and date range
+queries only open the months they cover. Changes to a user's archive hold
+the lock file archive/<user_id>.lock.
+"""
+import gzip
+import json
+import os
+import shutil
+import zlib
+from datetime import datetime
+
+from fileio import atomic_write, file_lock
+from storage import _dumps
+
+MANIFEST_VERSION = 1
+
+# Segment key for entries without a valid date, sorts before every month
+UNDATED_SEGMENT = '0000-00'
+
+
+def segment_key(entry):
+    """Archive segment (YYYY-MM) an entry belongs to"""
+    try:
+        return datetime.strptime(entry.get('date') or '', '%Y-%m-%d').strftime('%Y-%m')
+    except ValueError:
+        return UNDATED_SEGMENT
+
+
+def _id_range(entries):
+    """(min id, max id) of entries, (None, None) unless every id is an integer"""
+    ids = [entry.get('id') for entry in entries]
+    if not ids or not all(type(entry_id) is int for entry_id in ids):
+        return None, None
+    return min(ids), max(ids)
+
+
+class JournalArchive:
+    """Per-user archive segments below archive_dir"""
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+
+    def user_dir(self, user_id):
+        """Get the archive directory for specific user"""
+        return os.path.join(self.archive_dir, user_id)
+
+    def segment_path(self, user_id, key):
+        """Get the path of one archive segment"""
+        return os.path.join(self.user_dir(user_id), f'{key}.jsonl.gz')
+
+    def list_users(self):
+        """Get the ids of all users with archived entries"""
+        try:
+            names = os.listdir(self.archive_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if os.path.isdir(os.path.join(self.archive_dir, name)))
+
+    def lock(self, user_id):
+        """Lock a user's archive against changes from other threads and processes"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        return file_lock(self.user_dir(user_id))
+
+    def _manifest_path(self, user_id):
+        """Get the manifest path for specific user"""
+        return os.path.join(self.user_dir(user_id), 'manifest.json')
+
+    def manifest(self, user_id):
+        """Get {segment key: {'count', 'min_id', 'max_id'}} for user"""
+        try:
+            with open(self._manifest_path(user_id), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return self._rebuild_manifest(user_id)
+        if manifest.get('version') != MANIFEST_VERSION:
+            return self._rebuild_manifest(user_id)
+        return manifest['segments']
+
+    def _rebuild_manifest(self, user_id):
+        """Recreate a missing or unreadable manifest from the segments"""
+        segments = {}
+        try:
+            names = os.listdir(self.user_dir(user_id))
+        except FileNotFoundError:
+            return segments
+        for name in names:
+            if name.endswith('.jsonl.gz'):
+                key = name[:-len('.jsonl.gz')]
+                segments[key] = self._describe(self._read_segment(user_id, key))
+        if segments:
+            self._write_manifest(user_id, segments)
+        return segments
+
+    def _describe(self, entries):
+        """Manifest record for a segment holding entries"""
+        min_id, max_id = _id_range(entries)
+        return {'count': len(entries), 'min_id': min_id, 'max_id': max_id}
+
+    def _write_manifest(self, user_id, segments):
+        """Write the manifest atomically"""
+        manifest = {'version': MANIFEST_VERSION, 'segments': segments}
+        atomic_write(self._manifest_path(user_id), json.dumps(manifest, separators=(',', ':')))
+
+    def _read_segment(self, user_id, key):
+        """Read one segment, oldest entry first"""
+        entries = []
+        try:
+            with gzip.open(self.segment_path(user_id, key), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except (FileNotFoundError, EOFError, gzip.BadGzipFile, zlib.error):
+            # A damaged file from an older version still yields the lines before the damage
+            pass
+        return entries
+
+    def _write_segment(self, user_id, key, entries, segments):
+        """Replace one segment (oldest entry first) and its manifest record"""
+        path = self.segment_path(user_id, key)
+        if entries:
+            data = ''.join(_dumps(entry) + '\n' for entry in entries)
+            atomic_write(path, gzip.compress(data.encode('utf-8')), mode='wb')
+            segments[key] = self._describe(entries)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            segments.pop(key, None)
+
+    def _may_hold(self, record, entry_id):
+        """Check whether a segment's id range can include entry_id"""
+        if record['min_id'] is None or type(entry_id) is not int:
+            return True
+        return record['min_id'] <= entry_id <= record['max_id']
+
+    def count(self, user_id):
+        """Number of archived entries"""
+        return sum(record['count'] for record in self.manifest(user_id).values())
+
+    def add(self, user_id, entries):
+        """Archive entries (newest first) by appending to their month's segment"""
+        if not entries:
+            return
+        with self.lock(user_id):
+            os.makedirs(self.user_dir(user_id), exist_ok=True)
+            segments = self.manifest(user_id)
+            by_segment = {}
+            for entry in reversed(entries):
+                by_segment.setdefault(segment_key(entry), []).append(entry)
+            for key, segment_entries in by_segment.items():
+                path = self.segment_path(user_id, key)
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    data = b''
+                # Concatenated gzip members read back as one stream
+                member = gzip.compress(''.join(_dumps(entry) + '\n' for entry in segment_entries).encode('utf-8'))
+                atomic_write(path, data + member, mode='wb')
+                record = segments.get(key, {'count': 0, 'min_id': None, 'max_id': None})
+                min_id, max_id = _id_range(segment_entries)
+                if record['count'] and (record['min_id'] is None or min_id is None):
+                    min_id = max_id = None
+                elif record['count']:
+                    min_id, max_id = min(min_id, record['min_id']), max(max_id, record['max_id'])
+                segments[key] = {'count': record['count'] + len(segment_entries), 'min_id': min_id, 'max_id': max_id}
+            self._write_manifest(user_id, segments)
+
+    def iter_entries(self, user_id, date_from=None, date_to=None):
+        """Yield archived entries newest month first, newest entry first within a month
+
+        Only segments overlapping [date_from, date_to] are opened.
+        """
+        for key in sorted(self.manifest(user_id), reverse=True):
+            if (date_from or date_to) and key == UNDATED_SEGMENT:
+                continue
+            if (date_from and key < date_from[:7]) or (date_to and key > date_to[:7]):
+                continue
+            yield from reversed(self._read_segment(user_id, key))
+
+    def load(self, user_id):
+        """Load all archived entries, newest first"""
+        return list(self.iter_entries(user_id))
+
+    def query(self, user_id, before=None, date_from=None, date_to=None, limit=None):
+        """Get a page of archived entries, None if before is not archived"""
+        entries = []
+        if limit == 0:
+            return entries
+        started = before is None
+        segments = self.manifest(user_id)
+        for key in sorted(segments, reverse=True):
+            if not started and not self._may_hold(segments[key], before):
+                continue
+            if started and (date_from or date_to):
+                if key == UNDATED_SEGMENT or (date_from and key < date_from[:7]) or (date_to and key > date_to[:7]):
+                    continue
+            for entry in reversed(self._read_segment(user_id, key)):
+                if not started:
+                    started = entry.get('id') == before
+                    continue
+                date = entry.get('date') or ''
+                if (date_from and date < date_from) or (date_to and (not date or date > date_to)):
+                    continue
+                entries.append(entry)
+                if limit is not None and len(entries) >= limit:
+                    return entries
+        return entries if started else None
+
+    def get_many(self, user_id, entry_ids):
+        """Get archived entries by id, returns {id: entry}"""
+        wanted = set(entry_ids)
+        found = {}
+        if not wanted:
+            return found
+        for key, record in self.manifest(user_id).items():
+            if not any(self._may_hold(record, entry_id) for entry_id in wanted):
+                continue
+            for entry in self._read_segment(user_id, key):
+                if entry.get('id') in wanted:
+                    found[entry.get('id')] = entry
+        return found
+
+    def pop_many(self, user_id, entry_ids):
+        """Remove entries from the archive by id, returns {id: removed entry}"""
+        wanted = set(entry_ids)
+        removed = {}
+        if not wanted or not self.manifest(user_id):
+            return removed
+        with self.lock(user_id):
+            segments = self.manifest(user_id)
+            for key, record in list(segments.items()):
+                if not any(self._may_hold(record, entry_id) for entry_id in wanted):
+                    continue
+                entries = self._read_segment(user_id, key)
+                kept = [entry for entry in entries if entry.get('id') not in wanted]
+                if len(kept) != len(entries):
+                    removed.update((entry.get('id'), entry) for entry in entries if entry.get('id') in wanted)
+                    self._write_segment(user_id, key, kept, segments)
+            if removed:
+                self._write_manifest(user_id, segments)
+        return removed
+
+    def replace_many(self, user_id, entries):
+        """Rewrite archived entries in place, returns {id: previous entry} of those found
+
+        An entry whose date moved to another month goes to the end of that
+        month's segment.
+        """
+        by_id = {entry.get('id'): entry for entry in entries}
+        replaced = {}
+        if not by_id or not self.manifest(user_id):
+            return replaced
+        with self.lock(user_id):
+            segments = self.manifest(user_id)
+            moved = []
+            for key in sorted(segments):
+                if not any(self._may_hold(segments[key], entry_id) for entry_id in by_id):
+                    continue
+                kept = []
+                changed = False
+                for entry in self._read_segment(user_id, key):
+                    new_entry = by_id.get(entry.get('id'))
+                    if new_entry is None or entry.get('id') in replaced:
+                        kept.append(entry)
+                        continue
+                    replaced[entry.get('id')] = entry
+                    changed = True
+                    if segment_key(new_entry) == key:
+                        kept.append(new_entry)
+                    else:
+                        moved.append(new_entry)
+                if changed:
+                    self._write_segment(user_id, key, kept, segments)
+            if replaced:
+                self._write_manifest(user_id, segments)
+            if moved:
+                self.add(user_id, list(reversed(moved)))
+        return replaced
+
+    def delete(self, user_id, entry_id):
+        """Delete a single archived entry, returns the removed entry or None"""
+        return self.pop_many(user_id, [entry_id]).get(entry_id)
+
+    def prune(self, user_id, keep):
+        """Drop the oldest archived entries beyond keep, returns the dropped entries"""
+        if not self.manifest(user_id):
+            return []
+        pruned = []
+        with self.lock(user_id):
+            segments = self.manifest(user_id)
+            excess = sum(record['count'] for record in segments.values()) - max(keep, 0)
+            for key in sorted(segments):
+                if excess <= 0:
+                    break
+                entries = self._read_segment(user_id, key)
+                pruned.extend(entries[:excess])
+                self._write_segment(user_id, key, entries[excess:], segments)
+                excess -= len(entries)
+            if pruned:
+                self._write_manifest(user_id, segments)
+        return pruned
+
+    def clear(self, user_id):
+        """Remove every archived entry of user"""
+        with self.lock(user_id):
+            shutil.rmtree(self.user_dir(user_id), ignore_errors=True)
@@ -0,0 +1,113 @@
+"""Precompressed static pages served from memory with strong ETags
+
+index.html, reset-password.html and the API landing page used to be read
+(or built) and sent uncompressed on every request. Each page is now read
+and gzip/brotli-compressed once, and every variant gets a strong ETag
+from a hash of the page. A repeat visit costs one 304. Pages read from
+disk are reloaded when their file changes, so edits show up without a
+restart.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from flask import Response
+from werkzeug.exceptions import NotFound
+
+from responses import brotli, choose_encoding, compress
+
+# Pages are compressed once, so use the best ratio
+STATIC_COMPRESS_LEVEL = 9
+
+MIMETYPES = {'.html': 'text/html', '.css': 'text/css', '.js': 'text/javascript', '.json': 'application/json'}
+
+
+class Asset:
+    """One page with its compressed variants: {encoding or None: (body, etag)}"""
+
+    def __init__(self, body, mimetype, last_modified, stamp=None):
+        self.mimetype = mimetype
+        self.last_modified = last_modified
+        self.stamp = stamp
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        self.variants = {None: (body, digest)}
+        for encoding in ('gzip', 'br'):
+            if encoding == 'br' and brotli is None:
+                continue
+            data = compress(body, encoding, STATIC_COMPRESS_LEVEL)
+            if len(data) < len(body):
+                # Each encoding is a different byte sequence, so its own strong ETag
+                self.variants[encoding] = (data, f'{digest}-{encoding}')
+
+
+class StaticAssets:
+    """Pages served from memory
+
+    root: directory the file names are relative to
+    max_age: seconds browsers may reuse a page without asking (0 makes them
+    revalidate each time, which costs a 304)
+    """
+
+    def __init__(self, root, names=(), max_age=0):
+        self.root = root
+        self.max_age = max_age
+        self._assets = {}
+        for name in names:
+            self._load(name)
+
+    def _load(self, name):
+        """Read and compress a file, None if it does not exist"""
+        path = os.path.join(self.root, name)
+        try:
+            st = os.stat(path)
+            with open(path, 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            self._assets.pop(name, None)
+            return None
+        mimetype = MIMETYPES.get(os.path.splitext(name)[1], 'application/octet-stream')
+        last_modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+        asset = Asset(body, mimetype, last_modified, stamp=(st.st_mtime_ns, st.st_size))
+        self._assets[name] = asset
+        return asset
+
+    def add_text(self, name, text, mimetype='text/html'):
+        """Register a page built in code, e.g. a rendered template"""
+        self._assets[name] = Asset(text.encode('utf-8'), mimetype, datetime.now(timezone.utc).replace(microsecond=0))
+
+    def get(self, name):
+        """Get a page, None if it does not exist, reloading files that changed on disk"""
+        asset = self._assets.get(name)
+        if asset is not None and asset.stamp is None:
+            # Built in code, never changes
+            return asset
+        try:
+            st = os.stat(os.path.join(self.root, name))
+        except FileNotFoundError:
+            self._assets.pop(name, None)
+            return None
+        if asset is None or asset.stamp != (st.st_mtime_ns, st.st_size):
+            asset = self._load(name)
+        return asset
+
+    def serve(self, name, request):
+        """Build the response for a page, a 304 if the client's copy is current"""
+        asset = self.get(name)
+        if asset is None:
+            raise NotFound()
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding not in asset.variants:
+            encoding = 'gzip' if 'gzip' in asset.variants and request.accept_encodings.quality('gzip') else None
+        body, etag = asset.variants[encoding]
+        response = Response(body, mimetype=asset.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.last_modified = asset.last_modified
+        if self.max_age:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
@@ -0,0 +1,41 @@
+"""Lazily started background threads, once per process
+
+Buffers, the mailer and the sweepers start their threads on first use
+rather than at import. A gunicorn worker forked from a master that
+already started them inherits the state but not the threads, so each
+process has to start its own. ProcessStarter runs a start function the
+first time it is needed in each process.
+"""
+import os
+import threading
+
+
+class ProcessStarter:
+    """Run start() once per process, the first time ensure() is called
+
+    start must not call ensure() of the same starter.
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def active(self):
+        """Check whether start() has run in this process"""
+        return self._pid == os.getpid()
+
+    def ensure(self):
+        """Run start() if it has not run in this process yet"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            # Worker processes forked from a master need their own threads
+            if self._pid == os.getpid():
+                return
+            self.start()
+            self._pid = os.getpid()
+
+    def reset(self):
+        """Let the next ensure() run start() again"""
+        self._pid = None
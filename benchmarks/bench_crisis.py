@@ -0,0 +1,93 @@
+"""Per-entry cost of the crisis phrase check on long entries
+
+Compares the original check (phrase list rebuilt per call) with
+sentiment.is_crisis, and sentiment.find_crisis_phrases (one str.find scan
+per phrase) with a single-pass regex built from a trie of the phrases.
+
+    python benchmarks/bench_crisis.py
+"""
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sentiment import SERIOUS_NEGATIVE_WORDS, is_crisis, find_crisis_phrases
+
+WORDS = ('today I went for a walk and thought about work family friends the weather '
+         'dinner music sleep tired happy calm busy').split()
+
+
+def original_is_crisis(text):
+    """The check as it used to be written inside analyze_sentiment"""
+    serious_negative_words = [
+        'suicide', 'kill myself', 'end my life', 'want to die', 'better off dead',
+        'no reason to live', 'give up', 'can\'t take it anymore', 'hopeless',
+        'worthless', 'burden', 'everyone would be better off', 'no point'
+    ]
+    text_lower = text.lower()
+    for word in serious_negative_words:
+        if word in text_lower:
+            return True
+    return False
+
+
+def trie_pattern(words):
+    """Compile the phrases into one regex with shared prefixes factored out"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        pattern = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+        return f'(?:{pattern})?' if '' in node else pattern
+
+    return re.compile(build(trie))
+
+
+CRISIS_PATTERN = trie_pattern(SERIOUS_NEGATIVE_WORDS)
+
+
+def regex_find_all(text):
+    """Every match and position in a single regex pass"""
+    return [
+        {'phrase': match.group(), 'start': match.start(), 'end': match.end()}
+        for match in CRISIS_PATTERN.finditer(text.lower())
+    ]
+
+
+def make_entry(words, phrase=None):
+    """Build a synthetic entry, optionally with a crisis phrase at the end"""
+    text = ' '.join(random.choice(WORDS) for _ in range(words))
+    return f'{text} {phrase}' if phrase else text
+
+
+def per_call(func, text, number):
+    """Best per-call time in microseconds"""
+    return min(timeit.repeat(lambda: func(text), number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    random.seed(0)
+    print(f'{"entry":24s} {"original":>10s} {"is_crisis":>10s} {"find all":>10s} {"regex all":>10s}')
+    for words in (50, 500, 5000):
+        for label, phrase in (('no match', None), ('match at end', 'no point')):
+            text = make_entry(words, phrase)
+            number = max(10, 20000 // words)
+            print(f'{words:5d} words, {label:12s} '
+                  f'{per_call(original_is_crisis, text, number):8.1f}us '
+                  f'{per_call(is_crisis, text, number):8.1f}us '
+                  f'{per_call(find_crisis_phrases, text, number):8.1f}us '
+                  f'{per_call(regex_find_all, text, number):8.1f}us')
+
+
+if __name__ == '__main__':
+    main()
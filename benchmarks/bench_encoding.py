@@ -0,0 +1,96 @@
+"""Bytes on disk, bytes on the wire and encode time per 1k journal entries
+
+Compares the old pretty-printed journal file with the minified JSON and
+JSON Lines formats the stores write now, a GET /api/journal body sent
+plain, gzip- and (if the brotli package is installed) brotli-encoded, and
+Flask's stdlib JSON encoder with FastJSONProvider.
+
+    python benchmarks/bench_encoding.py [entries]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import responses
+from responses import FastJSONProvider, compress
+
+WORDS = ('today I went for a walk and thought about work family friends the weather '
+         'dinner music sleep tired happy calm busy morning evening coffee rain sun').split()
+MOODS = ('happy', 'sad', 'neutral', 'anxious', 'angry')
+
+
+def make_entries(count):
+    """Synthetic entries, newest first"""
+    random.seed(0)
+    return [{
+        'id': 878606807171520 + count - i,
+        'date': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}',
+        'time': f'{i % 24:02d}:{i % 60:02d}:00',
+        'entry': ' '.join(random.choice(WORDS) for _ in range(random.randint(20, 80))),
+        'mood': random.choice(MOODS),
+        'suggestion': 'Take a moment to appreciate what went well today.'
+    } for i in range(count)]
+
+
+def best_of(func, repeat=20):
+    """Best wall time of func() in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    return min(times)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    entries = make_entries(count)
+    per_1k = 1000 / count
+
+    print('on disk, bytes per 1k entries')
+    disk = {
+        'pretty JSON (old)': json.dumps(entries, ensure_ascii=False, indent=2),
+        'minified JSON': json.dumps(entries, ensure_ascii=False, separators=(',', ':')),
+        'JSON Lines log': ''.join(json.dumps({'op': 'put', 'entry': entry}, ensure_ascii=False,
+                                             separators=(',', ':')) + '\n' for entry in entries),
+    }
+    for label, text in disk.items():
+        print(f'  {label:20s} {len(text.encode()) * per_1k:10.0f}')
+
+    stdlib_app = Flask('stdlib')
+    stdlib_app.json = DefaultJSONProvider(stdlib_app)
+    fast_app = Flask('fast')
+    fast_app.json = FastJSONProvider(fast_app)
+    payload = {'success': True, 'entries': entries, 'count': len(entries), 'next_before': None}
+
+    def encode(flask_app):
+        with flask_app.app_context():
+            return flask_app.json.response(payload).get_data()
+
+    body = encode(fast_app)
+    print('on the wire, bytes per 1k entries')
+    print(f'  {"identity":20s} {len(body) * per_1k:10.0f}')
+    for encoding in ('gzip', 'br'):
+        if encoding == 'br' and responses.brotli is None:
+            print(f'  {"br":20s} {"(pip install brotli)":>10s}')
+            continue
+        print(f'  {encoding:20s} {len(compress(body, encoding)) * per_1k:10.0f}'
+              f'   {best_of(lambda: compress(body, encoding)) * per_1k:6.2f}ms')
+
+    print('encode time per 1k entries')
+    print(f'  {"stdlib jsonify":20s} {best_of(lambda: encode(stdlib_app)) * per_1k:9.2f}ms')
+    if responses.orjson is None:
+        print(f'  {"orjson":20s} (pip install orjson)')
+    else:
+        print(f'  {"FastJSONProvider":20s} {best_of(lambda: encode(fast_app)) * per_1k:9.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Full-text search on a 100k-entry synthetic journal
+
+Compares scanning every entry (what a search over load_entries would do)
+with search.SearchIndex for a plain word, a phrase and a prefix query, and
+reports how long building the index and indexing one more entry take.
+
+    python benchmarks/bench_search.py [entries]
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from search import SearchIndex
+
+WORDS = ('today I went for a walk and thought about work family friends the weather '
+         'dinner music sleep tired happy calm busy morning evening coffee rain sun '
+         'project meeting deadline gym run book movie call mother brother garden').split()
+
+QUERIES = [
+    ('word', 'garden', re.compile(r'\bgarden\b')),
+    ('phrase', '"very tired"', re.compile(r'\bvery tired\b')),
+    ('prefix', 'meet*', re.compile(r'\bmeet\w*')),
+]
+
+
+def make_entries(count):
+    """Synthetic entries of 20-80 words, newest first"""
+    random.seed(0)
+    entries = []
+    for i in range(count):
+        words = [random.choice(WORDS) for _ in range(random.randint(20, 80))]
+        if i % 500 == 0:
+            words.insert(random.randrange(len(words)), 'very tired')
+        entries.append({'id': count - i, 'date': '2024-01-01', 'entry': ' '.join(words)})
+    return entries
+
+
+def scan(entries, pattern, limit=20):
+    """Naive search: test every entry's text"""
+    return [entry['id'] for entry in entries if pattern.search(entry['entry'].lower())][:limit]
+
+
+def best_of(func, repeat=5):
+    """Best wall time of func() in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+    return min(times)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    entries = make_entries(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SearchIndex(os.path.join(tmp, 'search.db'))
+        started = time.perf_counter()
+        index.rebuild('bench', entries)
+        print(f'index {count} entries: {time.perf_counter() - started:.1f}s')
+        new_entry = {'id': count + 1, 'date': '2024-01-02', 'entry': 'one more entry about the garden'}
+        print(f'index one new entry: {best_of(lambda: index.update("bench", added=[new_entry])):.2f}ms')
+
+        print(f'{"query":8s} {"scan":>10s} {"index":>10s} {"matches":>8s}')
+        for label, query, pattern in QUERIES:
+            matches = len(index.search('bench', query, limit=count))
+            print(f'{label:8s} {best_of(lambda: scan(entries, pattern)):8.1f}ms '
+                  f'{best_of(lambda: index.search("bench", query)):8.2f}ms {matches:8d}')
+
+
+if __name__ == '__main__':
+    main()
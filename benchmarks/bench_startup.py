@@ -0,0 +1,65 @@
+"""Cold-start cost of each server entry point
+
+Starts a fresh interpreter per run and reports the median time to import
+each entry point, plus the whole process (interpreter start included).
+The entry points run in a temporary directory holding copies of the
+pages, so the data files they create or migrate on import stay out of
+the checkout. Run with -X importtime to see which modules dominate:
+
+    python benchmarks/bench_startup.py [runs]
+    python -X importtime -c "import app" 2> importtime.log
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Read (and compressed) by app.py on import
+PAGES = ('index.html', 'reset-password.html')
+
+# (label, directory added to sys.path, module)
+ENTRY_POINTS = [
+    ('app:app', ROOT, 'app'),
+    ('api/index.py', os.path.join(ROOT, 'api'), 'index'),
+    ('api/login.py', os.path.join(ROOT, 'api'), 'login'),
+    ('api/register.py', os.path.join(ROOT, 'api'), 'register'),
+]
+
+IMPORT_TIMER = (
+    'import sys, time; sys.path.insert(0, sys.argv[1]); '
+    't = time.perf_counter(); __import__(sys.argv[2]); '
+    'print(time.perf_counter() - t)'
+)
+
+
+def measure(workdir, path, module):
+    """Import time inside the child and total process time, in ms"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT_TIMER, path, module],
+        cwd=workdir, capture_output=True, text=True, check=True
+    )
+    total = time.perf_counter() - started
+    return float(result.stdout.strip().splitlines()[-1]) * 1000, total * 1000
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f'{"entry point":18s} {"import ms":>10s} {"process ms":>11s}  (median of {runs})')
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in PAGES:
+            shutil.copy(os.path.join(ROOT, name), workdir)
+        for label, path, module in ENTRY_POINTS:
+            samples = [measure(workdir, path, module) for _ in range(runs)]
+            import_ms = statistics.median(sample[0] for sample in samples)
+            process_ms = statistics.median(sample[1] for sample in samples)
+            print(f'{label:18s} {import_ms:10.1f} {process_ms:11.1f}')
+
+
+if __name__ == '__main__':
+    main()
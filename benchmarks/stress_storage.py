@@ -0,0 +1,120 @@
+"""Multi-process stress test for the file-based storage
+
+Starts several worker processes, each with its own copy of the app (as
+gunicorn workers would have), that register users and add entries to one
+shared journal and to their own journals at the same time. Afterwards it
+checks that no user, entry or stats update was lost and that no partial
+or temp files were left behind. Exits with status 1 on any failure.
+
+    python benchmarks/stress_storage.py [processes] [users] [entries]
+
+Set JOURNAL_BACKEND / STORAGE_BACKEND to stress another backend.
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# A small hot tier so the run also exercises archive rollovers
+os.environ.setdefault('JOURNAL_HOT_ENTRIES', '10')
+os.environ.setdefault('EMAIL_WORKERS', '0')
+os.environ.setdefault('ACTIVITY_FLUSH_COUNT', '1')
+
+SHARED_DEVICE = 'shared'
+
+
+def worker(workdir, number, users, entries, barrier):
+    """Register users and add entries from one process"""
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    import app
+
+    # Registering logs the client in, so journal requests use a second,
+    # anonymous client identified by X-Device-ID
+    client = app.app.test_client()
+    device_client = app.app.test_client()
+    barrier.wait()
+    failures = 0
+    for i in range(max(users, entries)):
+        if i < users:
+            response = client.post('/api/auth/register', json={
+                'username': f'p{number}u{i}',
+                'password': 'stress-test-1',
+                'email': f'p{number}u{i}@example.com'
+            })
+            failures += response.status_code != 200
+        if i < entries:
+            for device in (SHARED_DEVICE, f'device{number}'):
+                response = device_client.post('/api/journal', headers={'X-Device-ID': device},
+                                              json={'entry': f'entry {i} from process {number}', 'mood': 'neutral'})
+                failures += response.status_code != 200
+    # Pool workers are terminated without running atexit, so commit the
+    # buffered entries as a graceful shutdown would
+    app.write_buffer.flush()
+    return failures
+
+
+def check(workdir, processes, users, entries):
+    """Verify the files written by the workers, returns a list of problems"""
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    import app
+
+    problems = []
+    registered = app.load_users()
+    expected_users = {f'p{number}u{i}' for number in range(processes) for i in range(users)}
+    missing = expected_users - set(registered)
+    if missing:
+        problems.append(f'{len(missing)} of {len(expected_users)} users lost')
+
+    journals = [(f'device_{SHARED_DEVICE}', processes * entries)]
+    journals += [(f'device_device{number}', entries) for number in range(processes)]
+    for user_id, expected in journals:
+        loaded = app.load_entries(user_id)
+        ids = [entry['id'] for entry in loaded]
+        if len(loaded) != expected:
+            problems.append(f'{user_id}: {len(loaded)} entries, expected {expected}')
+        if len(set(ids)) != len(ids):
+            problems.append(f'{user_id}: duplicate entry ids')
+        stats = app.get_journal_stats(user_id)
+        if stats['total_entries'] != len(loaded):
+            problems.append(f"{user_id}: stats count {stats['total_entries']}, journal has {len(loaded)}")
+
+    for directory, _, names in os.walk(workdir):
+        leftovers = [name for name in names if name.endswith('.tmp')]
+        if leftovers:
+            problems.append(f'temp files left in {directory}: {leftovers}')
+    return problems
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    entries = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.setdefault('STORAGE_DB', os.path.join(workdir, 'journal.db'))
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Manager().Barrier(processes)
+        started = time.perf_counter()
+        with context.Pool(processes) as pool:
+            results = [pool.apply_async(worker, (workdir, number, users, entries, barrier))
+                       for number in range(processes)]
+            failures = sum(result.get() for result in results)
+        elapsed = time.perf_counter() - started
+        requests = processes * (users + 2 * entries)
+        print(f'{processes} processes, {requests} requests in {elapsed:.1f}s, {failures} failed')
+
+        problems = check(workdir, processes, users, entries)
+        for problem in problems:
+            print(f'FAIL: {problem}')
+        if failures or problems:
+            sys.exit(1)
+        print('OK: no lost users, entries or stats updates')
+
+
+if __name__ == '__main__':
+    main()
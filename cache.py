@@ -0,0 +1,83 @@
+"""Small in-process caches shared by the app's storage and analysis helpers"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by item count and approximate size
+
+    Each value is stored with a caller supplied size (e.g. bytes on disk).
+    The least recently used items are evicted once either limit is exceeded.
+    A limit of 0 or None means unlimited; max_items=0 disables the cache.
+    """
+
+    def __init__(self, max_items=None, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        """Whether the cache stores anything at all"""
+        return self.max_items != 0
+
+    def get(self, key, default=None):
+        """Get a cached value and mark it as recently used"""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, size=0):
+        """Store a value, evicting old items if the cache is over its limits"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._items and self._over_limit():
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _over_limit(self):
+        """Check whether either limit is exceeded"""
+        if self.max_items and len(self._items) > self.max_items:
+            return True
+        return bool(self.max_bytes) and self._bytes > self.max_bytes
+
+    def pop(self, key):
+        """Drop a cached value"""
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self._bytes -= item[1]
+
+    def clear(self):
+        """Drop all cached values"""
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Get hit/miss counters and current usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'items': len(self._items),
+                'bytes': self._bytes
+            }
@@ -0,0 +1,119 @@
+"""Crash-safe file writes and cross-process file locks
+
+Several gunicorn workers share the JSON files, so every read-modify-write
+runs under an advisory lock on <path>.lock and every rewrite goes to a
+temp file that is fsynced and then renamed over the original. Readers see
+either the old or the new file, never a partial one.
+
+Locks use fcntl.flock and are re-entrant within a thread. On platforms
+without fcntl (Windows) they only serialize threads of the same process.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Seconds to wait for a lock before giving up (STORAGE_LOCK_TIMEOUT)
+LOCK_TIMEOUT = float(os.environ.get('STORAGE_LOCK_TIMEOUT', 10))
+
+_held = threading.local()
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a file lock could not be acquired in time"""
+
+
+def _thread_lock(path):
+    """Process-wide lock for path, used where fcntl is not available"""
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(path, threading.Lock())
+
+
+@contextmanager
+def file_lock(path, timeout=None):
+    """Hold an exclusive lock on path for the duration of the block
+
+    Waits up to timeout seconds (LOCK_TIMEOUT by default) and raises
+    LockTimeout after that.
+    """
+    held = getattr(_held, 'paths', None)
+    if held is None:
+        held = _held.paths = {}
+    key = os.path.abspath(path)
+    if key in held:
+        held[key] += 1
+        try:
+            yield
+        finally:
+            held[key] -= 1
+        return
+
+    timeout = LOCK_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    if fcntl is None:
+        lock = _thread_lock(key)
+        if not lock.acquire(timeout=timeout):
+            raise LockTimeout(f'Timed out waiting for lock on {path}')
+        release = lock.release
+    else:
+        fd = os.open(f'{path}.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        delay = 0.002
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise LockTimeout(f'Timed out waiting for lock on {path}')
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+
+        def release():
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    held[key] = 1
+    try:
+        yield
+    finally:
+        del held[key]
+        release()
+
+
+def _fsync_dir(path):
+    """Persist a rename by syncing the containing directory (POSIX only)"""
+    if fcntl is None:
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, data, mode='w'):
+    """Replace path with data via an fsynced temp file and os.replace
+
+    mode is 'w' for text (written as UTF-8) or 'wb' for bytes.
+    """
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    encoding = None if 'b' in mode else 'utf-8'
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(path)
@@ -0,0 +1,123 @@
+"""Time-ordered, unique journal entry IDs
+
+IDs are Snowflake-style integers:
+
+    | 41 bits: ms since 2020-01-01 | 6 bits: worker id | 6 bits: sequence |
+
+so they sort by creation time, need no file read, and two processes
+never hand out the same ID as long as their worker ids differ. 53 bits keep
+them exact as JavaScript numbers in the browser, and every new ID is larger
+than the old millisecond-timestamp IDs, so existing journals keep sorting
+correctly.
+
+The worker id comes from WORKER_ID. Without it each process claims a
+free slot by holding a lock on worker-<n>.lock in WORKER_ID_DIR, so up to
+64 live processes that share that directory (gunicorn workers on one
+host) always get different ids, and a restarted worker takes over the
+slot of the one it replaced. The search starts at a random slot, so
+processes that cannot see each other's locks (containers with their own
+/tmp, serverless instances) at least do not all pick the same id. Set
+WORKER_ID explicitly (0-63) when several hosts write the same journals.
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+EPOCH_MS = 1577836800000  # 2020-01-01T00:00:00Z
+
+WORKER_BITS = 6
+SEQUENCE_BITS = 6
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class IdGenerator:
+    """Generate unique IDs for one process
+
+    worker_id: 0-63, defaults to WORKER_ID or a free slot in lock_dir
+    lock_dir: where slots are claimed, WORKER_ID_DIR or a directory in the
+    system temp dir by default. Forked worker processes claim their own
+    slot on first use.
+    """
+
+    def __init__(self, worker_id=None, lock_dir=None):
+        self.configured_worker_id = worker_id
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker_id = None
+        self._slot_file = None
+        self._last_ms = 0
+        self._sequence = 0
+
+    def _claim_slot(self):
+        """Lock a free worker-<n>.lock and keep it open, returns n"""
+        if self._slot_file is not None:
+            # Inherited from the parent process, which still holds that slot
+            self._slot_file.close()
+            self._slot_file = None
+        start = random.randint(0, MAX_WORKER_ID)
+        if fcntl is None:
+            return start
+        lock_dir = self.lock_dir or os.environ.get('WORKER_ID_DIR') or os.path.join(tempfile.gettempdir(), 'journal-worker-ids')
+        try:
+            os.makedirs(lock_dir, exist_ok=True)
+            for offset in range(MAX_WORKER_ID + 1):
+                slot = (start + offset) & MAX_WORKER_ID
+                f = open(os.path.join(lock_dir, f'worker-{slot}.lock'), 'a')
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    f.close()
+                    continue
+                self._slot_file = f
+                return slot
+        except OSError as e:
+            print(f"Could not claim a worker id in {lock_dir} ({e}), set WORKER_ID")
+            return start
+        print(f"All {MAX_WORKER_ID + 1} worker ids in {lock_dir} are taken, entry ids may collide; set WORKER_ID")
+        return start
+
+    def _reset_for_process(self):
+        """Choose this process's worker id and start a fresh sequence"""
+        worker_id = self.configured_worker_id
+        if worker_id is None:
+            worker_id = os.environ.get('WORKER_ID')
+        worker_id = int(worker_id) if worker_id is not None else self._claim_slot()
+        self._worker_id = worker_id & MAX_WORKER_ID
+        self._pid = os.getpid()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self):
+        """Get the next ID"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_for_process()
+            # Never go back in time, even if the wall clock does
+            now_ms = max(int(time.time() * 1000) - EPOCH_MS, self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # Sequence used up for this millisecond, borrow the next one
+                    now_ms += 1
+                    self._sequence = 0
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return (now_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self._worker_id << SEQUENCE_BITS) | self._sequence
+
+
+_generator = IdGenerator()
+
+
+def next_entry_id():
+    """Get a new entry ID from the process-wide generator"""
+    return _generator.next_id()
@@ -0,0 +1,77 @@
+"""Secret keys for signing session cookies, with rotation
+
+A key generated at import differs between gunicorn workers and changes
+on every restart, so a cookie signed by one worker was rejected by the
+next and a deploy logged everyone out. The signing key now comes from
+SECRET_KEY. Without it, a key is generated once into SECRET_KEY_FILE and
+shared by every worker on the host.
+
+To rotate, put the new key in SECRET_KEY and move the old one to
+SECRET_KEY_FALLBACKS (comma-separated). New cookies are signed with the
+new key, and cookies signed with a fallback are still accepted. Drop the
+fallback once those sessions have aged out.
+"""
+import os
+import secrets
+
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import URLSafeTimedSerializer
+
+
+def _read_or_create_key(path):
+    """Read the key in path, generating it first if the file does not exist"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            key = f.read().strip()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    # Publish the key with a hard link so concurrent workers never read a
+    # half-written file and all end up with the first key created
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+    finally:
+        os.remove(tmp_path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+
+def load_secret_keys(key=None, fallbacks=(), key_file=None):
+    """Get the accepted keys, oldest first with the signing key last
+
+    key: the signing key, read from (or generated into) key_file when empty
+    fallbacks: retired keys that are still accepted
+    """
+    if not key and key_file:
+        try:
+            key = _read_or_create_key(key_file)
+        except OSError as e:
+            # e.g. a read-only filesystem on a serverless host
+            print(f"Could not read or create {key_file} ({e}), sessions will not survive a restart; set SECRET_KEY")
+    if not key:
+        key = secrets.token_hex(32)
+    return [fallback.strip() for fallback in fallbacks if fallback.strip()] + [key]
+
+
+class RotatingSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions signed with the newest key that still accept older ones"""
+
+    def __init__(self, secret_keys):
+        self.secret_keys = secret_keys
+
+    def get_signing_serializer(self, app):
+        """Serializer that signs with the last key and verifies with all of them"""
+        return URLSafeTimedSerializer(
+            self.secret_keys,
+            salt=self.salt,
+            serializer=self.serializer,
+            signer_kwargs=dict(key_derivation=self.key_derivation, digest_method=self.digest_method)
+        )
@@ -0,0 +1,151 @@
+"""Outbound email delivery
+
+Messages are queued by the request handlers and delivered by a small pool
+of background worker threads. Each worker keeps its authenticated SMTP
+connection open between messages and reconnects when the relay drops it,
+so a slow relay no longer holds up the HTTP response.
+"""
+import atexit
+import queue
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from background import ProcessStarter
+
+_STOP = object()
+
+
+def build_message(config, to_email, subject, html_content, text_content=None):
+    """Build a multipart email with optional plain text alternative"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = config['sender_email']
+    msg['To'] = to_email
+    if text_content:
+        text_part = MIMEText(text_content, 'plain')
+        msg.attach(text_part)
+    html_part = MIMEText(html_content, 'html')
+    msg.attach(html_part)
+    return msg
+
+
+def open_connection(config, timeout=30):
+    """Open an SMTP connection, upgrade it to TLS and log in
+
+    Set 'use_tls' to False and leave 'sender_password' empty in the config to
+    talk to a plain local test server.
+    """
+    server = smtplib.SMTP(config['smtp_server'], config['smtp_port'], timeout=timeout)
+    if config.get('use_tls', True):
+        server.starttls()
+    if config.get('sender_password'):
+        server.login(config['sender_email'], config['sender_password'])
+    return server
+
+
+class MailQueue:
+    """Background email delivery with connection reuse and retries
+
+    workers: number of delivery threads (and open SMTP connections)
+    max_attempts: attempts per message before it is dropped
+    backoff: delay before the first retry, doubled on every further attempt
+    idle_timeout: seconds after which an unused connection is closed
+    """
+
+    def __init__(self, config, workers=2, max_attempts=4, backoff=2.0, idle_timeout=60):
+        self.config = config
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue()
+        self._threads = []
+        self._pool = ProcessStarter(self._start_workers)
+        self.sent = 0
+        self.failed = 0
+        atexit.register(self.close)
+
+    def enqueue(self, to_email, subject, html_content, text_content=None):
+        """Queue a message for delivery and return immediately"""
+        msg = build_message(self.config, to_email, subject, html_content, text_content)
+        self._ensure_workers()
+        self._queue.put((msg, 1))
+        return True
+
+    def _ensure_workers(self):
+        """Start the worker pool in this process if it is not running"""
+        self._pool.ensure()
+
+    def _start_workers(self):
+        """Start the worker threads"""
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'mail-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _retry_later(self, msg, attempt):
+        """Requeue a failed message after an exponential backoff"""
+        if attempt >= self.max_attempts:
+            self.failed += 1
+            print(f"Email sending error: giving up on message to {msg['To']} after {attempt} attempts")
+            return
+        delay = self.backoff * (2 ** (attempt - 1))
+        timer = threading.Timer(delay, self._queue.put, args=((msg, attempt + 1),))
+        timer.daemon = True
+        timer.start()
+
+    def _run(self):
+        """Worker loop: deliver queued messages over a reused connection"""
+        server = None
+        last_used = 0
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+            if server is not None and (item is None or time.monotonic() - last_used > self.idle_timeout):
+                self._quit(server)
+                server = None
+            if item is None:
+                continue
+            msg, attempt = item
+            try:
+                if server is None:
+                    server = open_connection(self.config)
+                server.send_message(msg)
+                self.sent += 1
+                last_used = time.monotonic()
+            except Exception as e:
+                print(f"Email sending error: {e}")
+                self._quit(server)
+                server = None
+                self._retry_later(msg, attempt)
+            finally:
+                self._queue.task_done()
+        self._quit(server)
+
+    def _quit(self, server):
+        """Close a connection, ignoring errors from a dead socket"""
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    def close(self, timeout=5):
+        """Stop the workers once queued messages have been attempted"""
+        if not self._pool.active():
+            return
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self._pool.reset()
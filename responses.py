@@ -0,0 +1,110 @@
+"""Fast JSON encoding and negotiated compression for API responses
+
+jsonify goes through FastJSONProvider, which encodes with orjson when it
+is installed (several times faster than the stdlib encoder on a page of
+entries) and falls back to Flask's stdlib encoder otherwise or for values
+orjson cannot handle. compress_response gzip- or brotli-encodes larger
+text responses for clients that accept it (brotli only when the optional
+brotli package is installed).
+"""
+import gzip
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response types worth compressing, everything else is sent as is
+COMPRESSIBLE_TYPES = (
+    'application/json', 'text/html', 'text/plain', 'text/css',
+    'text/javascript', 'application/javascript'
+)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson when available
+
+    Output matches the stdlib provider (sorted keys, Flask's encoding of
+    dates and other extra types) except that non-ASCII text is written as
+    UTF-8 instead of \\u escapes. Pretty-printed debug output still uses
+    the stdlib encoder.
+    """
+
+    def _orjson_options(self):
+        """orjson flags that mirror the provider's settings"""
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        """Serialize obj to a JSON string"""
+        if orjson is not None and not kwargs:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode('utf-8')
+            except TypeError:
+                # e.g. integers beyond 64 bits, let the stdlib deal with them
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        """Build a JSON response, encoding straight to bytes with orjson"""
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        if orjson is None or pretty:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, default=self.default,
+                                option=self._orjson_options() | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def choose_encoding(accept_encodings):
+    """Pick 'br' or 'gzip' from a parsed Accept-Encoding header, None for identity"""
+    br = accept_encodings.quality('br') if brotli is not None else 0
+    gzip_q = accept_encodings.quality('gzip')
+    if br and br >= gzip_q:
+        return 'br'
+    if gzip_q:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, level=6):
+    """Encode bytes with 'gzip' or 'br'"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_response(response, accept_encodings, min_size=500, level=6):
+    """Compress a buffered text response if the client accepts it
+
+    Streamed and file responses, tiny bodies and responses that already
+    have a Content-Encoding are left alone.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    response.set_data(compress(data, encoding, level))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,128 @@
+"""Full-text search over journal entries
+
+Entry texts are kept in an SQLite FTS5 inverted index next to the other
+SQLite tables (STORAGE_DB), whatever journal backend is in use. A user's
+entries are indexed on their first search and kept up to date as entries
+are added, re-scored and deleted.
+
+Queries are plain words (all must match), "quoted phrases" and word*
+prefixes, ranked by BM25 with newer entries first on ties.
+"""
+import hashlib
+import re
+
+from storage import get_database
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_docs (
+    rowid INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    entry_id NOT NULL,
+    UNIQUE (user_id, entry_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(user_key, text, tokenize = 'unicode61 remove_diacritics 2');
+CREATE TABLE IF NOT EXISTS search_users (
+    user_id TEXT PRIMARY KEY
+);
+"""
+
+# Query terms: "a phrase", word* or word
+_QUERY_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+_WORD = re.compile(r'\w+')
+
+
+def _user_key(user_id):
+    """Single-token key that restricts a match to one user's entries"""
+    return 'u' + hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:16]
+
+
+def parse_query(query):
+    """Turn a user query into an FTS5 expression, None if it has no words"""
+    parts = []
+    for match in _QUERY_TOKEN.finditer(query):
+        phrase, word = match.groups()
+        if phrase is not None:
+            words = _WORD.findall(phrase)
+            if words:
+                parts.append('"' + ' '.join(words) + '"')
+            continue
+        tokens = _WORD.findall(word)
+        for i, token in enumerate(tokens):
+            # Only the last word of a token like half-way* is a prefix
+            prefix = word.endswith('*') and i == len(tokens) - 1
+            parts.append(f'"{token}"*' if prefix else f'"{token}"')
+    if not parts:
+        return None
+    return ' AND '.join(parts)
+
+
+class SearchIndex:
+    """Per-user inverted index of entry texts in SQLite FTS5"""
+
+    def __init__(self, db_path=None):
+        self.db = get_database(db_path)
+        with self.db.connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def is_indexed(self, user_id):
+        """Check whether a user's journal has been indexed"""
+        row = self.db.connect().execute('SELECT 1 FROM search_users WHERE user_id = ?', (user_id,)).fetchone()
+        return row is not None
+
+    def _remove(self, conn, user_id, entry_ids):
+        """Drop entries from the index"""
+        for entry_id in entry_ids:
+            row = conn.execute(
+                'SELECT rowid FROM search_docs WHERE user_id = ? AND entry_id = ?', (user_id, entry_id)
+            ).fetchone()
+            if row is not None:
+                conn.execute('DELETE FROM search_fts WHERE rowid = ?', row)
+                conn.execute('DELETE FROM search_docs WHERE rowid = ?', row)
+
+    def _add(self, conn, user_id, entries):
+        """Index entries, replacing earlier versions with the same id"""
+        self._remove(conn, user_id, [entry.get('id') for entry in entries])
+        user_key = _user_key(user_id)
+        for entry in entries:
+            cursor = conn.execute(
+                'INSERT INTO search_docs (user_id, entry_id) VALUES (?, ?)', (user_id, entry.get('id'))
+            )
+            conn.execute(
+                'INSERT INTO search_fts (rowid, user_key, text) VALUES (?, ?, ?)',
+                (cursor.lastrowid, user_key, entry.get('entry', ''))
+            )
+
+    def rebuild(self, user_id, entries):
+        """Index a user's whole journal from scratch"""
+        with self.db.connect() as conn:
+            rows = conn.execute('SELECT rowid FROM search_docs WHERE user_id = ?', (user_id,)).fetchall()
+            conn.executemany('DELETE FROM search_fts WHERE rowid = ?', rows)
+            conn.execute('DELETE FROM search_docs WHERE user_id = ?', (user_id,))
+            # Oldest first, so newer entries get higher rowids
+            self._add(conn, user_id, list(reversed(entries)))
+            conn.execute('INSERT OR IGNORE INTO search_users (user_id) VALUES (?)', (user_id,))
+
+    def update(self, user_id, added=(), removed=()):
+        """Apply added and removed entries if the user's journal is indexed"""
+        if not added and not removed:
+            return
+        with self.db.connect() as conn:
+            if conn.execute('SELECT 1 FROM search_users WHERE user_id = ?', (user_id,)).fetchone() is None:
+                return
+            added_ids = {entry.get('id') for entry in added}
+            self._remove(conn, user_id, [entry.get('id') for entry in removed if entry.get('id') not in added_ids])
+            self._add(conn, user_id, list(added))
+
+    def search(self, user_id, query, limit=20):
+        """Get [(entry_id, score)] best match first, higher scores are better"""
+        expression = parse_query(query)
+        if expression is None:
+            return []
+        rows = self.db.connect().execute(
+            'SELECT d.entry_id, bm25(search_fts, 0.0, 1.0) AS rank FROM search_fts '
+            'JOIN search_docs d ON d.rowid = search_fts.rowid '
+            'WHERE search_fts MATCH ? ORDER BY rank, search_fts.rowid DESC LIMIT ?',
+            (f'user_key : "{_user_key(user_id)}" AND text : ({expression})', limit)
+        ).fetchall()
+        # bm25() is lower for better matches, flip it for the API
+        return [(entry_id, round(-rank, 4)) for entry_id, rank in rows]
@@ -0,0 +1,271 @@
+"""Mood analysis for journal entries
+
+analyze_sentiment scores a single entry. analyze_batch scores many entries
+in one call: the crisis check runs over the whole batch first, only the
+remaining texts are parsed by TextBlob, and large batches are spread over
+a pool of worker processes.
+
+TextBlob polarities are memoized by a hash of the whitespace-normalized
+text, so re-submitted or re-imported entries skip TextBlob. Set
+SENTIMENT_CACHE_FILE to keep the cache across restarts. The crisis check
+and the label thresholds run on every call, so edits to
+SERIOUS_NEGATIVE_WORDS apply to cached texts too.
+
+TextBlob and its sentiment lexicon take a few hundred milliseconds to load,
+so they are imported on first use; call preload_sentiment() to pay that
+cost up front (e.g. in the gunicorn master so forked workers share it).
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import LRUCache
+
+# Phrases that mark an entry as 'Crisis' regardless of its polarity
+SERIOUS_NEGATIVE_WORDS = [
+    'suicide', 'kill myself', 'end my life', 'want to die', 'better off dead',
+    'no reason to live', 'give up', 'can\'t take it anymore', 'hopeless',
+    'worthless', 'burden', 'everyone would be better off', 'no point'
+]
+
+# Built once at import instead of on every call. A handful of C-level
+# substring searches beats a compiled alternation regex for this list size
+# (see benchmarks/bench_crisis.py)
+_CRISIS_PHRASES = tuple(SERIOUS_NEGATIVE_WORDS)
+
+# Batches at least this large are scored in worker processes
+PARALLEL_THRESHOLD = 200
+
+# Memoized results (SENTIMENT_CACHE_SIZE=0 disables the cache)
+SENTIMENT_CACHE_SIZE = int(os.environ.get('SENTIMENT_CACHE_SIZE', 10000))
+SENTIMENT_CACHE_FILE = os.environ.get('SENTIMENT_CACHE_FILE')
+
+_pool = None
+_pool_pid = None
+
+_TextBlob = None
+_textblob_lock = threading.Lock()
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different copies share a cache key"""
+    return ' '.join(text.split())
+
+
+def text_key(text):
+    """Cache key for a text"""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class SentimentCache:
+    """Bounded cache of TextBlob polarities keyed by text hash
+
+    With a path, new results are appended to a JSON Lines file which is
+    read back (newest results winning) the first time the cache is used.
+    """
+
+    def __init__(self, max_items=10000, path=None):
+        self.cache = LRUCache(max_items=max_items)
+        self.path = path
+        self._loaded = path is None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Read persisted results on first use, then compact the file"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            records = {}
+            lines = 0
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        lines += 1
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        if 'polarity' not in record:
+                            # Whole results from older versions, rescored on use
+                            continue
+                        records.pop(record['key'], None)
+                        records[record['key']] = record['polarity']
+            except FileNotFoundError:
+                return
+            keep = list(records.items())
+            if self.cache.max_items:
+                keep = keep[-self.cache.max_items:]
+            for key, value in keep:
+                self.cache.put(key, value)
+            # Drop duplicates and evicted results once they dominate the file
+            if lines > 2 * len(keep):
+                tmp_path = f'{self.path}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for key, value in keep:
+                        f.write(json.dumps({'key': key, 'polarity': value}) + '\n')
+                os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        """Get a cached polarity or None"""
+        if not self.cache.enabled:
+            return None
+        if not self._loaded:
+            self._load()
+        return self.cache.get(key)
+
+    def put(self, key, value):
+        """Store a polarity (and append it to the cache file)"""
+        if not self.cache.enabled:
+            return
+        self.cache.put(key, value)
+        if self.path:
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'key': key, 'polarity': value}) + '\n')
+            except OSError as e:
+                print(f"Sentiment cache write error: {e}")
+
+    def stats(self):
+        """Get hit/miss counters"""
+        return self.cache.stats()
+
+
+sentiment_cache = SentimentCache(max_items=SENTIMENT_CACHE_SIZE, path=SENTIMENT_CACHE_FILE)
+
+
+def is_crisis(text):
+    """Check text for serious negative phrases"""
+    text_lower = text.lower()
+    for phrase in _CRISIS_PHRASES:
+        if phrase in text_lower:
+            return True
+    return False
+
+
+def find_crisis_phrases(text):
+    """Find every serious negative phrase in text with its position
+
+    Returns a list of {'phrase', 'start', 'end'} dicts in text order.
+    """
+    text_lower = text.lower()
+    matches = []
+    for phrase in _CRISIS_PHRASES:
+        start = text_lower.find(phrase)
+        while start != -1:
+            end = start + len(phrase)
+            matches.append({'phrase': phrase, 'start': start, 'end': end})
+            start = text_lower.find(phrase, end)
+    matches.sort(key=lambda match: match['start'])
+    return matches
+
+
+def _get_textblob():
+    """Import TextBlob on first use"""
+    global _TextBlob
+    if _TextBlob is None:
+        with _textblob_lock:
+            if _TextBlob is None:
+                from textblob import TextBlob
+                _TextBlob = TextBlob
+    return _TextBlob
+
+
+def preload_sentiment():
+    """Import TextBlob and load its sentiment lexicon now instead of on first use"""
+    polarity('preload')
+
+
+def polarity(text):
+    """Get TextBlob polarity in [-1, 1]"""
+    return _get_textblob()(text).sentiment.polarity
+
+
+def label_for_polarity(value):
+    """Map a polarity score to a mood label"""
+    # More sensitive thresholds for better detection
+    if value > 0.05:  # Lowered from 0.1
+        return 'Positive'
+    elif value < -0.05:  # Raised from -0.1
+        return 'Negative'
+    else:
+        return 'Neutral'
+
+
+def _crisis_result(text):
+    """Result for a text with serious negative phrases, None otherwise"""
+    phrases = sorted({match['phrase'] for match in find_crisis_phrases(text)})
+    if not phrases:
+        return None
+    # Special category for serious thoughts, polarity is not needed
+    return {'label': 'Crisis', 'polarity': None, 'crisis_phrases': phrases}
+
+
+def _polarity_result(value):
+    """Result for a text without serious negative phrases"""
+    return {'label': label_for_polarity(value), 'polarity': value, 'crisis_phrases': []}
+
+
+def analyze(text):
+    """Analyze text, returns {'label', 'polarity', 'crisis_phrases'}"""
+    # Check for serious negative thoughts first
+    result = _crisis_result(text)
+    if result is not None:
+        return result
+    key = text_key(text)
+    value = sentiment_cache.get(key)
+    if value is None:
+        value = polarity(text)
+        sentiment_cache.put(key, value)
+    return _polarity_result(value)
+
+
+def analyze_sentiment(text):
+    """Analyze sentiment using TextBlob with improved thresholds and crisis detection"""
+    return analyze(text)['label']
+
+
+def _polarities(texts):
+    """Score a chunk of texts (runs inside worker processes)"""
+    return [polarity(text) for text in texts]
+
+
+def _get_pool(workers):
+    """Get the process pool for this process, creating it on first use"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def analyze_batch(texts, workers=None, parallel_threshold=PARALLEL_THRESHOLD):
+    """Analyze many texts at once, returns mood labels in the same order"""
+    results = [_crisis_result(text) for text in texts]
+    keys = [text_key(text) if result is None else None for text, result in zip(texts, results)]
+    for i, key in enumerate(keys):
+        if key is not None:
+            value = sentiment_cache.get(key)
+            if value is not None:
+                results[i] = _polarity_result(value)
+    pending = [i for i, result in enumerate(results) if result is None]
+    pending_texts = [texts[i] for i in pending]
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(pending_texts) >= parallel_threshold:
+        chunk_size = -(-len(pending_texts) // workers)
+        chunks = [pending_texts[i:i + chunk_size] for i in range(0, len(pending_texts), chunk_size)]
+        try:
+            scores = [score for chunk in _get_pool(workers).map(_polarities, chunks) for score in chunk]
+        except Exception as e:
+            print(f"Sentiment pool error, scoring inline: {e}")
+            scores = _polarities(pending_texts)
+    else:
+        scores = _polarities(pending_texts)
+
+    for i, score in zip(pending, scores):
+        results[i] = _polarity_result(score)
+        sentiment_cache.put(keys[i], score)
+    return [result['label'] for result in results]
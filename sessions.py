@@ -0,0 +1,130 @@
+"""Server-side login sessions with a cached user profile
+
+The session cookie only says who is logged in. Checking that the user
+still exists used to parse users.json on every /api/auth/status call.
+Instead each login gets a server-side session record holding the
+validated profile. Auth checks read that record until it expires after
+SESSION_TTL seconds, and only then look at the user store again.
+Changing a user's data drops the cached records of all their sessions.
+
+'memory' keeps the records in the worker process. A request that lands
+on another worker, or comes in after a restart, just revalidates once
+against the user store. 'sqlite' keeps them in the shared STORAGE_DB, so
+every worker sees a logout or invalidation at once.
+"""
+import json
+import secrets
+import threading
+from datetime import datetime, timedelta
+
+from storage import get_database
+
+
+def _expiry(ttl):
+    """ISO timestamp ttl seconds from now"""
+    return (datetime.now() + timedelta(seconds=ttl)).isoformat()
+
+
+class MemorySessionStore:
+    """Session records held in this process, {sid: record}"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._sessions = {}
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def create(self, username, profile, sid=None):
+        """Store a session for username under sid (a new one by default), returns the sid"""
+        sid = sid or secrets.token_urlsafe(24)
+        with self._lock:
+            self._sessions[sid] = {'username': username, 'profile': profile, 'expires_at': _expiry(self.ttl)}
+            self._by_user.setdefault(username, set()).add(sid)
+        return sid
+
+    def get(self, sid):
+        """Get a live session record or None"""
+        with self._lock:
+            record = self._sessions.get(sid)
+            if record is None or record['expires_at'] > datetime.now().isoformat():
+                return record
+        self.delete(sid)
+        return None
+
+    def delete(self, sid):
+        """Forget a single session"""
+        with self._lock:
+            record = self._sessions.pop(sid, None)
+            if record is not None:
+                self._by_user.get(record['username'], set()).discard(sid)
+
+    def invalidate_user(self, username):
+        """Forget every session of username"""
+        with self._lock:
+            for sid in self._by_user.pop(username, ()):
+                self._sessions.pop(sid, None)
+
+    def purge_expired(self, now):
+        """Drop sessions that expired at or before now, returns how many"""
+        with self._lock:
+            expired = [sid for sid, record in self._sessions.items() if record['expires_at'] <= now]
+        for sid in expired:
+            self.delete(sid)
+        return len(expired)
+
+
+class SQLiteSessionStore:
+    """Session records in the shared SQLite database, seen by every worker"""
+
+    def __init__(self, ttl=300, db_path=None):
+        self.ttl = ttl
+        self.db = get_database(db_path)
+
+    def create(self, username, profile, sid=None):
+        """Store a session for username under sid (a new one by default), returns the sid"""
+        sid = sid or secrets.token_urlsafe(24)
+        with self.db.connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (sid, username, expires_at, data) VALUES (?, ?, ?, ?)',
+                (sid, username, _expiry(self.ttl), json.dumps(profile, ensure_ascii=False))
+            )
+        return sid
+
+    def get(self, sid):
+        """Get a live session record or None"""
+        row = self.db.connect().execute(
+            'SELECT username, expires_at, data FROM sessions WHERE sid = ? AND expires_at > ?',
+            (sid, datetime.now().isoformat())
+        ).fetchone()
+        if row is None:
+            return None
+        return {'username': row[0], 'expires_at': row[1], 'profile': json.loads(row[2])}
+
+    def delete(self, sid):
+        """Forget a single session"""
+        with self.db.connect() as conn:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def invalidate_user(self, username):
+        """Forget every session of username"""
+        with self.db.connect() as conn:
+            conn.execute('DELETE FROM sessions WHERE username = ?', (username,))
+
+    def purge_expired(self, now):
+        """Drop sessions that expired at or before now, returns how many"""
+        with self.db.connect() as conn:
+            cursor = conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+        return cursor.rowcount
+
+
+SESSION_BACKENDS = {
+    'memory': MemorySessionStore,
+    'sqlite': SQLiteSessionStore,
+}
+
+
+def create_session_store(backend='memory', ttl=300):
+    """Create the session backend named by backend"""
+    if backend not in SESSION_BACKENDS:
+        raise ValueError(f"Unknown session backend: {backend}")
+    return SESSION_BACKENDS[backend](ttl=ttl)
@@ -0,0 +1,351 @@
+"""Precomputed per-user journal statistics
+
+Each user's mood counts, running mood sum and first/last entry dates are
+kept in a small journal_data/stats_<user_id>.json file next to the
+journal. add_entry and delete_entry update it incrementally, so /api/stats
+and /api/user-info never have to read the entries. If the file is missing
+or an update cannot be applied incrementally, it is rebuilt from the
+journal. Rebuild everything with `flask --app app rebuild-stats`.
+
+Per-day rollups (mood counts and mood sum per day) for /api/stats/trend
+live apart from it in journal_data/trend_<user_id>/<YYYY-MM>.json, one
+file per month. A journal write only rewrites the months of the entries
+it touches, and the stats file stays the same size however long the
+history is. Week and month buckets are summed from the days when a trend
+is requested.
+
+Since the file is rewritten on every journal write, it also carries the
+journal's revision (a counter bumped on each write) and the time of the
+last write. The API derives ETag and Last-Modified from them.
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from fileio import atomic_write, file_lock
+
+# Numeric value of each mood for the average; other moods count as 0
+MOOD_VALUES = {'Positive': 1, 'Neutral': 0, 'Negative': -1}
+
+STATS_VERSION = 3
+
+# Rollup buckets, keyed by the date the bucket starts
+TREND_BUCKETS = ('day', 'week', 'month')
+
+
+def empty_stats():
+    """Statistics of an empty journal"""
+    return {
+        'version': STATS_VERSION,
+        'total_entries': 0,
+        'mood_counts': {},
+        'mood_sum': 0,
+        'first_entry_date': None,
+        'first_date_count': 0,
+        'last_entry_date': None,
+        'last_date_count': 0
+    }
+
+
+def bucket_start(date, bucket):
+    """First day of the bucket containing date (a datetime.date) as YYYY-MM-DD"""
+    if bucket == 'week':
+        date = date - timedelta(days=date.weekday())
+    elif bucket == 'month':
+        date = date.replace(day=1)
+    return date.strftime('%Y-%m-%d')
+
+
+def entry_day(entry):
+    """An entry's date as YYYY-MM-DD, None if it has no valid date"""
+    try:
+        return datetime.strptime(entry.get('date') or '', '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def add_to_days(days, entry):
+    """Count one entry in its day's rollup, days is {YYYY-MM-DD: rollup}"""
+    day = entry_day(entry)
+    if day is None:
+        return
+    mood = entry.get('mood', 'Unknown')
+    rollup = days.setdefault(day, {'total': 0, 'mood_counts': {}, 'mood_sum': 0})
+    rollup['total'] += 1
+    rollup['mood_counts'][mood] = rollup['mood_counts'].get(mood, 0) + 1
+    rollup['mood_sum'] += MOOD_VALUES.get(mood, 0)
+
+
+def remove_from_days(days, entry):
+    """Uncount one entry from its day's rollup, returns False if it doesn't hold it"""
+    day = entry_day(entry)
+    if day is None:
+        return True
+    mood = entry.get('mood', 'Unknown')
+    rollup = days.get(day)
+    if rollup is None or rollup['mood_counts'].get(mood, 0) <= 0:
+        return False
+    rollup['total'] -= 1
+    rollup['mood_counts'][mood] -= 1
+    if not rollup['mood_counts'][mood]:
+        del rollup['mood_counts'][mood]
+    rollup['mood_sum'] -= MOOD_VALUES.get(mood, 0)
+    if not rollup['total']:
+        del days[day]
+    return True
+
+
+def compute_days(entries):
+    """Build day rollups from scratch, grouped by month: {YYYY-MM: {day: rollup}}"""
+    months = {}
+    for entry in entries:
+        day = entry_day(entry)
+        if day is not None:
+            add_to_days(months.setdefault(day[:7], {}), entry)
+    return months
+
+
+def add_to_stats(stats, entry):
+    """Count one entry"""
+    mood = entry.get('mood', 'Unknown')
+    stats['total_entries'] += 1
+    stats['mood_counts'][mood] = stats['mood_counts'].get(mood, 0) + 1
+    stats['mood_sum'] += MOOD_VALUES.get(entry.get('mood', 'Neutral'), 0)
+
+    date = entry.get('date')
+    if not date:
+        return
+    first = stats['first_entry_date']
+    if first is None or date < first:
+        stats['first_entry_date'] = date
+        stats['first_date_count'] = 1
+    elif date == first:
+        stats['first_date_count'] += 1
+    last = stats['last_entry_date']
+    if last is None or date > last:
+        stats['last_entry_date'] = date
+        stats['last_date_count'] = 1
+    elif date == last:
+        stats['last_date_count'] += 1
+
+
+def remove_from_stats(stats, entry):
+    """Uncount one entry, returns False if the stats must be rebuilt instead"""
+    mood = entry.get('mood', 'Unknown')
+    if stats['total_entries'] <= 0 or stats['mood_counts'].get(mood, 0) <= 0:
+        return False
+    stats['total_entries'] -= 1
+    stats['mood_counts'][mood] -= 1
+    if not stats['mood_counts'][mood]:
+        del stats['mood_counts'][mood]
+    stats['mood_sum'] -= MOOD_VALUES.get(entry.get('mood', 'Neutral'), 0)
+
+    if not stats['total_entries']:
+        stats.update(first_entry_date=None, first_date_count=0, last_entry_date=None, last_date_count=0)
+        return True
+
+    date = entry.get('date')
+    for bound in ('first', 'last'):
+        if date and date == stats[f'{bound}_entry_date']:
+            stats[f'{bound}_date_count'] -= 1
+            if stats[f'{bound}_date_count'] <= 0:
+                # The boundary date is gone, only the entries know the next one
+                return False
+    return True
+
+
+def compute_stats(entries):
+    """Build statistics from scratch"""
+    stats = empty_stats()
+    for entry in entries:
+        add_to_stats(stats, entry)
+    return stats
+
+
+def average_mood(stats):
+    """Overall mood label from the running mood sum"""
+    if not stats['total_entries']:
+        return 'No data'
+    return mood_label(stats['mood_sum'] / stats['total_entries'])
+
+
+def mood_label(avg_mood_value):
+    """Map an average mood value in [-1, 1] to a label"""
+    if avg_mood_value > 0.3:
+        return 'Positive'
+    elif avg_mood_value < -0.3:
+        return 'Negative'
+    else:
+        return 'Neutral'
+
+
+def trend(days, bucket, date_from=None, date_to=None):
+    """Per-bucket mood counts and averages from day rollups, oldest bucket first
+
+    date_from and date_to are YYYY-MM-DD strings; buckets containing any day
+    of the range are returned.
+    """
+    if date_from:
+        date_from = bucket_start(datetime.strptime(date_from, '%Y-%m-%d').date(), bucket)
+    rollups = {}
+    for day, day_rollup in days.items():
+        key = bucket_start(datetime.strptime(day, '%Y-%m-%d').date(), bucket)
+        rollup = rollups.setdefault(key, {'total': 0, 'mood_counts': {}, 'mood_sum': 0})
+        rollup['total'] += day_rollup['total']
+        rollup['mood_sum'] += day_rollup['mood_sum']
+        for mood, count in day_rollup['mood_counts'].items():
+            rollup['mood_counts'][mood] = rollup['mood_counts'].get(mood, 0) + count
+    points = []
+    for key in sorted(rollups):
+        if (date_from and key < date_from) or (date_to and key > date_to):
+            continue
+        rollup = rollups[key]
+        avg_mood_value = rollup['mood_sum'] / rollup['total']
+        points.append({
+            'start': key,
+            'total_entries': rollup['total'],
+            'mood_distribution': rollup['mood_counts'],
+            'average_mood_value': round(avg_mood_value, 3),
+            'average_mood': mood_label(avg_mood_value)
+        })
+    return points
+
+
+class StatsStore:
+    """Per-user statistics files kept next to the journals"""
+
+    def __init__(self, journal_dir, load_entries):
+        self.journal_dir = journal_dir
+        self.load_entries = load_entries
+
+    def path(self, user_id):
+        """Get stats file path for specific user"""
+        return os.path.join(self.journal_dir, f'stats_{user_id}.json')
+
+    def trend_dir(self, user_id):
+        """Get the directory of a user's per-month day rollups"""
+        return os.path.join(self.journal_dir, f'trend_{user_id}')
+
+    def _month_path(self, user_id, month):
+        """Get the day rollups file of one month (YYYY-MM)"""
+        return os.path.join(self.trend_dir(user_id), f'{month}.json')
+
+    def _read_month(self, user_id, month):
+        """Read one month's day rollups, {} if there are none"""
+        try:
+            with open(self._month_path(user_id, month), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+
+    def _write_month(self, user_id, month, days):
+        """Write one month's day rollups atomically, removing the file when empty"""
+        path = self._month_path(user_id, month)
+        if days:
+            atomic_write(path, json.dumps(days, ensure_ascii=False, separators=(',', ':')))
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def _months(self, user_id):
+        """Months (YYYY-MM) with day rollups, None if the directory is missing"""
+        try:
+            names = os.listdir(self.trend_dir(user_id))
+        except FileNotFoundError:
+            return None
+        return sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+
+    def lock(self, user_id):
+        """Lock a user's stats file, held around journal writes to keep both in step"""
+        return file_lock(self.path(user_id))
+
+    def _read(self, user_id):
+        """Read the stats file, None if it is missing or outdated"""
+        try:
+            with open(self.path(user_id), 'r', encoding='utf-8') as f:
+                stats = json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return None
+        return stats if stats.get('version') == STATS_VERSION else None
+
+    def _revision(self, user_id):
+        """Get the journal revision recorded in the stats file, 0 if there is none"""
+        try:
+            with open(self.path(user_id), 'r', encoding='utf-8') as f:
+                return json.load(f).get('revision', 0)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return 0
+
+    def _write(self, user_id, stats):
+        """Write the stats file atomically as the journal's next revision"""
+        stats['revision'] = stats.get('revision', 0) + 1
+        stats['updated_at'] = time.time()
+        atomic_write(self.path(user_id), json.dumps(stats, ensure_ascii=False, separators=(',', ':')))
+
+    def rebuild(self, user_id):
+        """Recompute a user's stats from the journal"""
+        with self.lock(user_id):
+            entries = self.load_entries(user_id)
+            stats = compute_stats(entries)
+            # Keep counting so rebuilt stats never reuse an old revision
+            stats['revision'] = self._revision(user_id)
+            # Don't leave stats files behind for visitors without a journal
+            if stats['total_entries'] or os.path.exists(self.path(user_id)):
+                os.makedirs(self.trend_dir(user_id), exist_ok=True)
+                months = compute_days(entries)
+                for month in set(self._months(user_id) or ()) | set(months):
+                    self._write_month(user_id, month, months.get(month, {}))
+                self._write(user_id, stats)
+        return stats
+
+    def get(self, user_id):
+        """Get a user's stats, building them on first use"""
+        stats = self._read(user_id)
+        if stats is None:
+            stats = self.rebuild(user_id)
+        return stats
+
+    def update(self, user_id, added=(), removed=()):
+        """Apply added and removed entries to a user's stats"""
+        with self.lock(user_id):
+            stats = self._read(user_id)
+            if stats is None:
+                return self.rebuild(user_id)
+            if self._months(user_id) is None:
+                return self.rebuild(user_id)
+            # Only the months of the changed entries are read and rewritten
+            months = {}
+            for entry in list(removed) + list(added):
+                day = entry_day(entry)
+                if day is not None and day[:7] not in months:
+                    months[day[:7]] = self._read_month(user_id, day[:7])
+            for entry in removed:
+                if not remove_from_stats(stats, entry):
+                    return self.rebuild(user_id)
+                day = entry_day(entry)
+                if day is not None and not remove_from_days(months[day[:7]], entry):
+                    return self.rebuild(user_id)
+            for entry in added:
+                add_to_stats(stats, entry)
+                day = entry_day(entry)
+                if day is not None:
+                    add_to_days(months[day[:7]], entry)
+            for month, days in months.items():
+                self._write_month(user_id, month, days)
+            self._write(user_id, stats)
+        return stats
+
+    def trend(self, user_id, bucket, date_from=None, date_to=None):
+        """Get a user's mood trend, reading only the months in the range"""
+        stats = self.get(user_id)
+        months = self._months(user_id)
+        if months is None and stats['total_entries']:
+            self.rebuild(user_id)
+            months = self._months(user_id)
+        first = bucket_start(datetime.strptime(date_from, '%Y-%m-%d').date(), bucket)[:7] if date_from else None
+        days = {}
+        for month in months or ():
+            if (first and month < first) or (date_to and month > date_to[:7]):
+                continue
+            days.update(self._read_month(user_id, month))
+        return trend(days, bucket, date_from, date_to)
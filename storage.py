@@ -0,0 +1,1361 @@
+"""Storage backends for journal entries, users and verification tokens
+
+The Flask app talks to storage only through the load_entries/save_entries,
+get_user/put_user and get_verification_token style helpers in app.py,
+which delegate to one of the backends below.
+
+STORAGE_BACKEND selects 'json' files (default) or a shared 'sqlite' database
+for users and tokens. JOURNAL_BACKEND selects the journal backend and
+defaults to 'sqlite' when STORAGE_BACKEND is sqlite, 'log' otherwise.
+TieredJournalStore keeps that backend small by moving older entries into
+a compressed archive (see archive.py).
+"""
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right
+
+from cache import LRUCache
+from fileio import atomic_write, file_lock
+
+# Default backend names, can be overridden with STORAGE_BACKEND/JOURNAL_BACKEND
+DEFAULT_STORAGE_BACKEND = 'json'
+DEFAULT_JOURNAL_BACKEND = 'log'
+
+# SQLite database file, can be overridden with STORAGE_DB
+DEFAULT_DB_PATH = 'journal.db'
+
+# Compact the log once it holds this many records and at least half are dead
+COMPACT_MIN_RECORDS = 64
+COMPACT_DEAD_RATIO = 0.5
+
+# Users whose log offset index is kept in memory
+LOG_INDEX_MAX_USERS = 1024
+
+
+def _dumps(obj):
+    """Serialize a record on a single line without padding"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def _merge_entries(current, entries):
+    """Apply put_many to a newest-first list
+
+    Entries whose id is already present replace it in place, the rest are
+    added in order so the last one becomes the newest.
+    """
+    incoming = {entry.get('id'): entry for entry in entries}
+    merged = [incoming.pop(entry.get('id'), entry) for entry in current]
+    new_entries = [entry for entry in entries if entry.get('id') in incoming]
+    return list(reversed(new_entries)) + merged
+
+
+def _index_entries(entries):
+    """Index a newest-first list by entry id and by date for query_entries"""
+    return {
+        'positions': {entry.get('id'): pos for pos, entry in enumerate(entries)},
+        'dates': sorted((entry.get('date') or '', pos) for pos, entry in enumerate(entries))
+    }
+
+
+def query_entries(entries, before=None, date_from=None, date_to=None, limit=None, index=None):
+    """Page through a newest-first list of entries
+
+    Returns up to limit entries older than the entry with id before, dated
+    within [date_from, date_to] (YYYY-MM-DD), newest first. Returns None if
+    before is not the id of an entry. With a prebuilt index only the
+    matching positions are visited.
+    """
+    if index is None:
+        index = _index_entries(entries)
+    start = 0
+    if before is not None:
+        position = index['positions'].get(before)
+        if position is None:
+            return None
+        start = position + 1
+    if date_from or date_to:
+        dates = index['dates']
+        # Entries without a date sort first and never match a date range
+        lo = bisect_left(dates, (date_from or '0',))
+        hi = bisect_right(dates, (date_to, len(entries))) if date_to else len(dates)
+        positions = sorted(pos for _, pos in dates[lo:hi] if pos >= start)
+    else:
+        positions = range(start, len(entries))
+    if limit is not None:
+        positions = positions[:limit]
+    return [entries[pos] for pos in positions]
+
+
+def _list_user_files(journal_dir, suffix):
+    """User ids of journal_<user_id><suffix> files in journal_dir"""
+    try:
+        names = os.listdir(journal_dir)
+    except FileNotFoundError:
+        return []
+    return [
+        name[len('journal_'):-len(suffix)]
+        for name in names
+        if name.startswith('journal_') and name.endswith(suffix)
+    ]
+
+
+def _file_stamp(path):
+    """Identify the current version of a file by inode, mtime and size"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _replace_file(path, lines):
+    """Atomically replace path with lines"""
+    atomic_write(path, ''.join(line + '\n' for line in lines))
+
+
+class JsonJournalStore:
+    """Original layout: one JSON list per user, newest first
+
+    Lists are written minified. Pretty-printed files from older versions
+    are read as they are and rewritten compactly on the next save.
+    """
+
+    def __init__(self, journal_dir, max_entries=None):
+        self.journal_dir = journal_dir
+        self.max_entries = max_entries
+
+    def path(self, user_id):
+        """Get journal file path for specific user"""
+        return os.path.join(self.journal_dir, f'journal_{user_id}.json')
+
+    def stamp(self, user_id):
+        """Get a cheap version stamp for the user's journal, None if unknown"""
+        return _file_stamp(self.path(user_id))
+
+    def list_users(self):
+        """Get the ids of all users with a journal"""
+        return sorted(_list_user_files(self.journal_dir, '.json'))
+
+    def load(self, user_id):
+        """Load all entries for user, newest first"""
+        journal_file = self.path(user_id)
+        if os.path.exists(journal_file):
+            try:
+                with open(journal_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                return []
+        return []
+
+    def query(self, user_id, before=None, date_from=None, date_to=None, limit=None):
+        """Get a page of entries, newest first (see query_entries)"""
+        return query_entries(self.load(user_id), before, date_from, date_to, limit)
+
+    def get(self, user_id, entry_id):
+        """Get a single entry or None"""
+        return next((e for e in self.load(user_id) if e.get('id') == entry_id), None)
+
+    def save(self, user_id, entries):
+        """Replace all entries for user"""
+        if self.max_entries:
+            entries = entries[:self.max_entries]
+        with file_lock(self.path(user_id)):
+            atomic_write(self.path(user_id), _dumps(entries))
+
+    def append(self, user_id, entry):
+        """Add a single entry as the newest one"""
+        with file_lock(self.path(user_id)):
+            entries = self.load(user_id)
+            entries.insert(0, entry)
+            self.save(user_id, entries)
+
+    def put_many(self, user_id, entries):
+        """Add or replace several entries (oldest first) in one write"""
+        with file_lock(self.path(user_id)):
+            self.save(user_id, _merge_entries(self.load(user_id), entries))
+
+    def delete(self, user_id, entry_id):
+        """Delete a single entry, returns the removed entry or None"""
+        with file_lock(self.path(user_id)):
+            entries = self.load(user_id)
+            removed = next((e for e in entries if e.get('id') == entry_id), None)
+            if removed is None:
+                return None
+            self.save(user_id, [e for e in entries if e.get('id') != entry_id])
+            return removed
+
+
+class LogJournalStore:
+    """Append-only JSON Lines log per user, oldest record first
+
+    Each line is either {"op": "put", "entry": {...}} or
+    {"op": "del", "id": ...}. Adding or deleting an entry appends one short
+    line; the log is rewritten only when it is compacted, which happens on
+    load or delete once enough dead records have piled up or the entry cap
+    is exceeded.
+
+    An in-memory index maps each live entry id to the offset of its latest
+    put record, so get and delete read one line instead of replaying the
+    log. The index is extended by reading only what was appended since it
+    was last used, and rebuilt when compaction replaces the file.
+    """
+
+    def __init__(self, journal_dir, max_entries=None):
+        self.journal_dir = journal_dir
+        self.max_entries = max_entries
+        self._indexes = LRUCache(max_items=LOG_INDEX_MAX_USERS)
+        self._index_lock = threading.Lock()
+
+    def path(self, user_id):
+        """Get journal log path for specific user"""
+        return os.path.join(self.journal_dir, f'journal_{user_id}.jsonl')
+
+    def stamp(self, user_id):
+        """Get a cheap version stamp for the user's journal, None if unknown"""
+        return _file_stamp(self.path(user_id))
+
+    def list_users(self):
+        """Get the ids of all users with a journal"""
+        return sorted(set(_list_user_files(self.journal_dir, '.jsonl'))
+                      | set(_list_user_files(self.journal_dir, '.json')))
+
+    def legacy_path(self, user_id):
+        """Get path of the pre-log JSON journal for specific user"""
+        return os.path.join(self.journal_dir, f'journal_{user_id}.json')
+
+    def _migrate(self, user_id):
+        """Convert an old JSON journal into a log the first time it is seen"""
+        legacy_file = self.legacy_path(user_id)
+        if os.path.exists(self.path(user_id)) or not os.path.exists(legacy_file):
+            return
+        with file_lock(self.path(user_id)):
+            # Another process may have converted it while we waited
+            if os.path.exists(self.path(user_id)) or not os.path.exists(legacy_file):
+                return
+            entries = JsonJournalStore(self.journal_dir).load(user_id)
+            self.save(user_id, entries)
+            # Kept as a backup for rolling back to a version without logs
+            os.replace(legacy_file, f'{legacy_file}.bak')
+
+    def _read(self, user_id):
+        """Replay the log, returns (entries oldest first, record count)"""
+        live = {}
+        records = 0
+        try:
+            with open(self.path(user_id), 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn write at the tail of the log, skip it
+                        continue
+                    records += 1
+                    if record.get('op') == 'put':
+                        entry = record['entry']
+                        live[entry.get('id')] = entry
+                    elif record.get('op') == 'del':
+                        live.pop(record.get('id'), None)
+        except FileNotFoundError:
+            pass
+        return list(live.values()), records
+
+    def _offsets(self, user_id):
+        """Get the user's index: {'offsets': {entry id: (offset, length)}, 'records': n}"""
+        path = self.path(user_id)
+        with self._index_lock:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                self._indexes.pop(user_id)
+                return {'offsets': {}, 'records': 0}
+            index = self._indexes.get(user_id)
+            if index is None or index['ino'] != st.st_ino or st.st_size < index['size']:
+                index = {'ino': st.st_ino, 'size': 0, 'offsets': {}, 'records': 0}
+            if st.st_size > index['size']:
+                offset = index['size']
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            # Still being written, pick it up next time
+                            break
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            record = None
+                        if record and record.get('op') == 'put':
+                            index['offsets'][record['entry'].get('id')] = (offset, len(line))
+                            index['records'] += 1
+                        elif record and record.get('op') == 'del':
+                            index['offsets'].pop(record.get('id'), None)
+                            index['records'] += 1
+                        offset += len(line)
+                index['size'] = offset
+            self._indexes.put(user_id, index)
+            return index
+
+    def _read_entry(self, user_id, position):
+        """Read the entry of the put record at (offset, length)"""
+        offset, length = position
+        with open(self.path(user_id), 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))['entry']
+
+    def _needs_compaction(self, live_count, records):
+        """Check whether rewriting the log is worth it"""
+        if self.max_entries and live_count > self.max_entries:
+            return True
+        if records < COMPACT_MIN_RECORDS:
+            return False
+        return (records - live_count) / records >= COMPACT_DEAD_RATIO
+
+    def load(self, user_id):
+        """Load all entries for user, newest first"""
+        self._migrate(user_id)
+        entries, records = self._read(user_id)
+        if self._needs_compaction(len(entries), records):
+            with file_lock(self.path(user_id)):
+                # Re-read under the lock so appends made meanwhile are kept
+                entries, records = self._read(user_id)
+                if self._needs_compaction(len(entries), records):
+                    self.save(user_id, list(reversed(entries)))
+        entries.reverse()
+        if self.max_entries:
+            entries = entries[:self.max_entries]
+        return entries
+
+    def query(self, user_id, before=None, date_from=None, date_to=None, limit=None):
+        """Get a page of entries, newest first (see query_entries)"""
+        return query_entries(self.load(user_id), before, date_from, date_to, limit)
+
+    def save(self, user_id, entries):
+        """Replace all entries for user by writing a fresh, compacted log"""
+        if self.max_entries:
+            entries = entries[:self.max_entries]
+        lines = [_dumps({'op': 'put', 'entry': entry}) for entry in reversed(entries)]
+        with file_lock(self.path(user_id)):
+            _replace_file(self.path(user_id), lines)
+
+    def _append_records(self, user_id, records):
+        """Append records to the user's log with a single write"""
+        self._migrate(user_id)
+        data = ''.join(_dumps(record) + '\n' for record in records)
+        # Hold the lock so a concurrent compaction cannot swallow the append
+        with file_lock(self.path(user_id)):
+            with open(self.path(user_id), 'a', encoding='utf-8') as f:
+                f.write(data)
+
+    def _append_record(self, user_id, record):
+        """Append one record to the user's log"""
+        self._append_records(user_id, [record])
+
+    def append(self, user_id, entry):
+        """Add a single entry as the newest one"""
+        self._append_record(user_id, {'op': 'put', 'entry': entry})
+
+    def put_many(self, user_id, entries):
+        """Add or replace several entries (oldest first) in one write"""
+        self._append_records(user_id, [{'op': 'put', 'entry': entry} for entry in entries])
+
+    def get(self, user_id, entry_id):
+        """Get a single entry or None"""
+        self._migrate(user_id)
+        position = self._offsets(user_id)['offsets'].get(entry_id)
+        return self._read_entry(user_id, position) if position is not None else None
+
+    def delete(self, user_id, entry_id):
+        """Delete a single entry by appending a tombstone, returns the removed entry or None"""
+        self._migrate(user_id)
+        with file_lock(self.path(user_id)):
+            position = self._offsets(user_id)['offsets'].get(entry_id)
+            if position is None:
+                return None
+            removed = self._read_entry(user_id, position)
+            self._append_record(user_id, {'op': 'del', 'id': entry_id})
+            index = self._offsets(user_id)
+            if self._needs_compaction(len(index['offsets']), index['records']):
+                self.compact(user_id)
+        return removed
+
+    def compact(self, user_id):
+        """Rewrite the log so it only holds live entries"""
+        with file_lock(self.path(user_id)):
+            self.save(user_id, self.load(user_id))
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    date TEXT,
+    data TEXT NOT NULL,
+    UNIQUE (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_user_date ON entries (user_id, date, id);
+CREATE INDEX IF NOT EXISTS idx_entries_user_seq ON entries (user_id, seq);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    email TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users (email);
+CREATE TABLE IF NOT EXISTS tokens (
+    token TEXT PRIMARY KEY,
+    username TEXT,
+    expires_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tokens_expires ON tokens (expires_at);
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    expires_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_username ON sessions (username);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class Database:
+    """SQLite database in WAL mode with one connection per thread
+
+    WAL lets several gunicorn workers read while one of them writes, and the
+    busy timeout makes concurrent writers wait instead of failing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def connect(self):
+        """Get this thread's connection, opening it on first use
+
+        A worker forked from a master that already connected (gunicorn
+        --preload) inherits the master's thread-local connection, which
+        SQLite does not allow to be used across processes, so each process
+        opens its own.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path=None):
+    """Get the shared Database for path (STORAGE_DB by default)"""
+    path = path or os.environ.get('STORAGE_DB', DEFAULT_DB_PATH)
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = Database(path)
+        return _databases[path]
+
+
+class SQLiteJournalStore:
+    """Journal entries as rows of a shared SQLite table, indexed by user"""
+
+    def __init__(self, journal_dir, max_entries=None, db_path=None):
+        self.journal_dir = journal_dir
+        self.max_entries = max_entries
+        self.db = get_database(db_path)
+
+    def path(self, user_id):
+        """Get the database path (all users share one file)"""
+        return self.db.path
+
+    def stamp(self, user_id):
+        """Rows carry no cheap version, so SQLite journals are not cached"""
+        return None
+
+    def list_users(self):
+        """Get the ids of all users with a journal"""
+        rows = self.db.connect().execute('SELECT DISTINCT user_id FROM entries').fetchall()
+        user_ids = {row[0] for row in rows}
+        # Journals not yet imported from files
+        user_ids.update(LogJournalStore(self.journal_dir).list_users())
+        return sorted(user_ids)
+
+    def _migrate(self, user_id):
+        """Import a user's JSON or log journal file the first time it is seen"""
+        log_store = LogJournalStore(self.journal_dir)
+        stores = (log_store, JsonJournalStore(self.journal_dir))
+        if not any(os.path.exists(store.path(user_id)) for store in stores):
+            return
+        with file_lock(log_store.path(user_id)):
+            for store in stores:
+                journal_file = store.path(user_id)
+                # Another process may have imported it while we waited
+                if os.path.exists(journal_file):
+                    self.save(user_id, store.load(user_id))
+                    # Kept as a backup, like users.json
+                    os.replace(journal_file, f'{journal_file}.bak')
+
+    def _insert(self, conn, user_id, entry):
+        """Insert or replace a single entry row"""
+        conn.execute(
+            'INSERT INTO entries (user_id, id, date, data) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (user_id, id) DO UPDATE SET date = excluded.date, data = excluded.data',
+            (user_id, entry.get('id'), entry.get('date'), _dumps(entry))
+        )
+
+    def _trim(self, conn, user_id):
+        """Drop the oldest entries beyond max_entries"""
+        if self.max_entries:
+            conn.execute(
+                'DELETE FROM entries WHERE user_id = ? AND seq <= ('
+                'SELECT seq FROM entries WHERE user_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)',
+                (user_id, user_id, self.max_entries)
+            )
+
+    def load(self, user_id):
+        """Load all entries for user, newest first"""
+        self._migrate(user_id)
+        query = 'SELECT data FROM entries WHERE user_id = ? ORDER BY seq DESC'
+        params = (user_id,)
+        if self.max_entries:
+            query += ' LIMIT ?'
+            params += (self.max_entries,)
+        rows = self.db.connect().execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def query(self, user_id, before=None, date_from=None, date_to=None, limit=None):
+        """Get a page of entries, newest first, reading only the matching rows"""
+        self._migrate(user_id)
+        conn = self.db.connect()
+        query = 'SELECT data FROM entries WHERE user_id = ?'
+        params = [user_id]
+        if before is not None:
+            row = conn.execute(
+                'SELECT seq FROM entries WHERE user_id = ? AND id = ?', (user_id, before)
+            ).fetchone()
+            if row is None:
+                return None
+            query += ' AND seq < ?'
+            params.append(row[0])
+        if date_from:
+            query += ' AND date >= ?'
+            params.append(date_from)
+        if date_to:
+            query += ' AND date <= ?'
+            params.append(date_to)
+        query += ' ORDER BY seq DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        rows = conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def save(self, user_id, entries):
+        """Replace all entries for user"""
+        if self.max_entries:
+            entries = entries[:self.max_entries]
+        with self.db.connect() as conn:
+            conn.execute('DELETE FROM entries WHERE user_id = ?', (user_id,))
+            for entry in reversed(entries):
+                self._insert(conn, user_id, entry)
+
+    def append(self, user_id, entry):
+        """Add a single entry as the newest one"""
+        self._migrate(user_id)
+        with self.db.connect() as conn:
+            self._insert(conn, user_id, entry)
+            self._trim(conn, user_id)
+
+    def put_many(self, user_id, entries):
+        """Add or replace several entries (oldest first) in one transaction"""
+        self._migrate(user_id)
+        with self.db.connect() as conn:
+            for entry in entries:
+                self._insert(conn, user_id, entry)
+            self._trim(conn, user_id)
+
+    def get(self, user_id, entry_id):
+        """Get a single entry or None"""
+        self._migrate(user_id)
+        row = self.db.connect().execute(
+            'SELECT data FROM entries WHERE user_id = ? AND id = ?', (user_id, entry_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, user_id, entry_id):
+        """Delete a single entry, returns the removed entry or None"""
+        self._migrate(user_id)
+        with self.db.connect() as conn:
+            row = conn.execute(
+                'SELECT data FROM entries WHERE user_id = ? AND id = ?', (user_id, entry_id)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM entries WHERE user_id = ? AND id = ?', (user_id, entry_id))
+        return json.loads(row[0])
+
+
+class CachedJournalStore:
+    """LRU cache of parsed journals in front of another journal backend
+
+    Cached journals are validated against the backend's stamp (file inode,
+    mtime and size) on every read, so writes made by other processes are
+    picked up. Writes made through this wrapper update the cache in place.
+    Queries use an id/date index built once per cached journal version.
+    """
+
+    def __init__(self, store, max_users=256, max_bytes=64 * 1024 * 1024):
+        self.store = store
+        self.cache = LRUCache(max_items=max_users, max_bytes=max_bytes)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def _remember(self, user_id, entries):
+        """Cache entries under the journal's current stamp"""
+        stamp = self.store.stamp(user_id)
+        if stamp is None:
+            self.cache.pop(user_id)
+            return
+        # The query index is built on first use, see query()
+        self.cache.put(user_id, (stamp, entries, {}), size=stamp[-1])
+
+    def _cached_item(self, user_id):
+        """Get the cached (stamp, entries, index) if it still matches the journal on disk"""
+        if not self.cache.enabled:
+            return None
+        stamp = self.store.stamp(user_id)
+        if stamp is None:
+            # Nothing to validate against (e.g. SQLite), so never cached and not counted
+            return None
+        cached = self.cache.get(user_id)
+        if cached is None:
+            return None
+        if cached[0] != stamp:
+            self.cache.pop(user_id)
+            return None
+        return cached
+
+    def _cached(self, user_id):
+        """Get cached entries if they still match the journal on disk"""
+        cached = self._cached_item(user_id)
+        return cached[1] if cached is not None else None
+
+    def load(self, user_id):
+        """Load all entries for user, newest first"""
+        entries = self._cached(user_id)
+        if entries is None:
+            entries = self.store.load(user_id)
+            self._remember(user_id, entries)
+        return list(entries)
+
+    def query(self, user_id, before=None, date_from=None, date_to=None, limit=None):
+        """Get a page of entries, newest first, from the indexed cached journal"""
+        cached = self._cached_item(user_id)
+        if cached is None and self.cache.enabled and self.store.stamp(user_id) is not None:
+            self.load(user_id)
+            cached = self._cached_item(user_id)
+        if cached is None:
+            # Not cacheable (e.g. SQLite), let the backend answer
+            return self.store.query(user_id, before, date_from, date_to, limit)
+        _, entries, index = cached
+        if not index:
+            index.update(_index_entries(entries))
+        return query_entries(entries, before, date_from, date_to, limit, index=index)
+
+    def get(self, user_id, entry_id):
+        """Get a single entry or None, from the cached journal's id index if it is current"""
+        cached = self._cached_item(user_id)
+        if cached is None:
+            return self.store.get(user_id, entry_id)
+        _, entries, index = cached
+        if not index:
+            index.update(_index_entries(entries))
+        position = index['positions'].get(entry_id)
+        return entries[position] if position is not None else None
+
+    def save(self, user_id, entries):
+        """Replace all entries for user and cache them"""
+        self.store.save(user_id, entries)
+        max_entries = getattr(self.store, 'max_entries', None)
+        self._remember(user_id, list(entries[:max_entries] if max_entries else entries))
+
+    def append(self, user_id, entry):
+        """Add a single entry, updating the cached journal if it is current"""
+        entries = self._cached(user_id)
+        self.store.append(user_id, entry)
+        if entries is None:
+            return
+        entries = [entry] + entries
+        max_entries = getattr(self.store, 'max_entries', None)
+        self._remember(user_id, entries[:max_entries] if max_entries else entries)
+
+    def put_many(self, user_id, new_entries):
+        """Add or replace several entries, updating the cached journal if it is current"""
+        entries = self._cached(user_id)
+        self.store.put_many(user_id, new_entries)
+        if entries is None:
+            return
+        entries = _merge_entries(entries, new_entries)
+        max_entries = getattr(self.store, 'max_entries', None)
+        self._remember(user_id, entries[:max_entries] if max_entries else entries)
+
+    def delete(self, user_id, entry_id):
+        """Delete a single entry, updating the cached journal if it is current"""
+        entries = self._cached(user_id)
+        removed = self.store.delete(user_id, entry_id)
+        if removed is not None and entries is not None:
+            self._remember(user_id, [e for e in entries if e.get('id') != entry_id])
+        return removed
+
+    def stats(self):
+        """Get cache hit/miss counters"""
+        return self.cache.stats()
+
+
+class TieredJournalStore:
+    """Hot journal backend plus a compressed archive of older entries
+
+    Only the newest hot_entries stay in the hot backend. Once it holds twice
+    as many, the older half is appended to the archive in one go, so most
+    writes never touch the archive. With max_entries set, the oldest
+    entries beyond that total (across both tiers) are dropped after every
+    write. Reads cover both tiers;
+    archived entries come after the hot ones, newest month first.
+    """
+
+    def __init__(self, store, archive, hot_entries=50, max_entries=None):
+        self.store = store
+        self.archive = archive
+        self.hot_entries = hot_entries
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def list_users(self):
+        """Get the ids of all users with a journal or an archive"""
+        return sorted(set(self.store.list_users()) | set(self.archive.list_users()))
+
+    def _rollover(self, user_id):
+        """Move entries beyond hot_entries to the archive, returns pruned entries"""
+        hot = self.store.load(user_id)
+        if len(hot) >= 2 * self.hot_entries:
+            with self._lock, self.archive.lock(user_id):
+                hot = self.store.load(user_id)
+                if len(hot) >= 2 * self.hot_entries:
+                    # Archive first: a crash in between leaves duplicates, never gaps
+                    self.archive.add(user_id, hot[self.hot_entries:])
+                    hot = hot[:self.hot_entries]
+                    self.store.save(user_id, hot)
+        return self._prune(user_id, hot)
+
+    def _prune(self, user_id, hot):
+        """Drop the oldest entries beyond max_entries across both tiers, returns them"""
+        if not self.max_entries or len(hot) + self.archive.count(user_id) <= self.max_entries:
+            return []
+        pruned = self.archive.prune(user_id, self.max_entries - len(hot))
+        if len(hot) > self.max_entries:
+            # Only when max_entries is below twice hot_entries
+            with self._lock:
+                hot = self.store.load(user_id)
+                pruned += hot[self.max_entries:]
+                self.store.save(user_id, hot[:self.max_entries])
+        return pruned
+
+    def load(self, user_id):
+        """Load all entries for user, hot entries first"""
+        hot = self.store.load(user_id)
+        hot_ids = {entry.get('id') for entry in hot}
+        return hot + [entry for entry in self.archive.load(user_id) if entry.get('id') not in hot_ids]
+
+    def query(self, user_id, before=None, date_from=None, date_to=None, limit=None):
+        """Get a page of entries, hot tier first, None if before is unknown"""
+        entries = self.store.query(user_id, before, date_from, date_to, limit)
+        if entries is None:
+            return self.archive.query(user_id, before, date_from, date_to, limit)
+        if limit is None or len(entries) < limit:
+            remaining = None if limit is None else limit - len(entries)
+            entries += self.archive.query(user_id, None, date_from, date_to, remaining)
+        return entries
+
+    def get(self, user_id, entry_id):
+        """Get a single entry from either tier or None"""
+        entry = self.store.get(user_id, entry_id)
+        if entry is None:
+            entry = self.archive.get_many(user_id, [entry_id]).get(entry_id)
+        return entry
+
+    def get_many(self, user_id, entry_ids):
+        """Get entries by id from either tier, returns {id: entry}"""
+        wanted = set(entry_ids)
+        found = {entry.get('id'): entry for entry in self.store.load(user_id) if entry.get('id') in wanted}
+        found.update(self.archive.get_many(user_id, wanted - set(found)))
+        return found
+
+    def save(self, user_id, entries):
+        """Replace all entries for user"""
+        with self._lock, self.archive.lock(user_id):
+            self.archive.clear(user_id)
+            self.archive.add(user_id, entries[self.hot_entries:])
+            self.store.save(user_id, entries[:self.hot_entries])
+
+    def append(self, user_id, entry):
+        """Add a single entry, returns entries dropped by max_entries"""
+        self.store.append(user_id, entry)
+        return self._rollover(user_id)
+
+    def put_many(self, user_id, entries):
+        """Add or replace several entries, returns entries dropped by max_entries
+
+        An archived entry is replaced in its archive segment, so editing it
+        keeps its place in the journal.
+        """
+        hot_ids = {entry.get('id') for entry in self.store.load(user_id)}
+        archived = self.archive.replace_many(user_id, [entry for entry in entries if entry.get('id') not in hot_ids])
+        hot = [entry for entry in entries if entry.get('id') not in archived]
+        if hot:
+            self.store.put_many(user_id, hot)
+        return self._rollover(user_id)
+
+    def delete(self, user_id, entry_id):
+        """Delete a single entry from either tier, returns the removed entry or None"""
+        removed = self.store.delete(user_id, entry_id)
+        if removed is None:
+            removed = self.archive.delete(user_id, entry_id)
+        return removed
+
+
+JOURNAL_BACKENDS = {
+    'json': JsonJournalStore,
+    'log': LogJournalStore,
+    'sqlite': SQLiteJournalStore,
+}
+
+
+def storage_backend_name():
+    """Get the backend name for users and tokens"""
+    return os.environ.get('STORAGE_BACKEND', DEFAULT_STORAGE_BACKEND)
+
+
+def create_journal_store(journal_dir, backend=None, **options):
+    """Create the journal backend named by backend or JOURNAL_BACKEND"""
+    default = 'sqlite' if storage_backend_name() == 'sqlite' else DEFAULT_JOURNAL_BACKEND
+    name = backend or os.environ.get('JOURNAL_BACKEND', default)
+    if name not in JOURNAL_BACKENDS:
+        raise ValueError(f"Unknown journal backend: {name}")
+    return JOURNAL_BACKENDS[name](journal_dir, **options)
+
+
+class JsonDocumentStore:
+    """A dict of records kept in one minified JSON file
+
+    Point operations load and rewrite the whole file, matching the original
+    load_users/save_users behaviour. Pretty-printed files from older
+    versions are still read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def stamp(self):
+        """Get a cheap version stamp for the file, None if it does not exist"""
+        return _file_stamp(self.path)
+
+    def load_all(self):
+        """Load all records"""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                return {}
+        return {}
+
+    def save_all(self, records):
+        """Replace all records"""
+        with file_lock(self.path):
+            atomic_write(self.path, _dumps(records))
+
+    def get(self, key):
+        """Get a single record or None"""
+        return self.load_all().get(key)
+
+    def put(self, key, record):
+        """Insert or replace a single record"""
+        with file_lock(self.path):
+            records = self.load_all()
+            records[key] = record
+            self.save_all(records)
+
+    def delete(self, key):
+        """Delete a single record, returns False if it was not found"""
+        with file_lock(self.path):
+            records = self.load_all()
+            if key not in records:
+                return False
+            del records[key]
+            self.save_all(records)
+            return True
+
+    def update_many(self, updates):
+        """Merge {key: {field: value}} into existing records in one write"""
+        with file_lock(self.path):
+            records = self.load_all()
+            for key, fields in updates.items():
+                if key in records:
+                    records[key].update(fields)
+            self.save_all(records)
+
+
+class JsonUserStore(JsonDocumentStore):
+    """Users kept in users.json, keyed by username"""
+
+    def find_by_email(self, email):
+        """Get the username registered with email, or None"""
+        for username, user_data in self.load_all().items():
+            if user_data.get('email') == email:
+                return username
+        return None
+
+
+class UserDirectory:
+    """Users held in memory with a secondary email -> username index
+
+    Sits in front of the JSON user store so lookups by username or email are
+    dictionary hits instead of a parse and scan of users.json. The directory
+    is built at startup, updated in place on every write made through it and
+    rebuilt whenever the file's stamp shows another process changed it.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.path = store.path
+        self._lock = threading.RLock()
+        self._users = {}
+        self._by_email = {}
+        self._has_duplicates = False
+        self._stamp = None
+        self._rebuild()
+
+    def _rebuild(self):
+        """Reload all users and rebuild the email index"""
+        self._stamp = self.store.stamp()
+        self._users = self.store.load_all()
+        self._by_email = {}
+        self._has_duplicates = False
+        for username, user_data in self._users.items():
+            email = user_data.get('email')
+            if email:
+                if email in self._by_email:
+                    self._has_duplicates = True
+                self._by_email.setdefault(email, username)
+
+    def _refresh(self):
+        """Rebuild if users.json was changed behind our back"""
+        if self.store.stamp() != self._stamp:
+            self._rebuild()
+
+    def _persist(self):
+        """Write the directory back to the store and remember its stamp"""
+        self.store.save_all(self._users)
+        self._stamp = self.store.stamp()
+
+    def _unindex(self, username):
+        """Drop username's email from the index"""
+        email = self._users.get(username, {}).get('email')
+        if email and self._by_email.get(email) == username:
+            del self._by_email[email]
+            if self._has_duplicates:
+                # Another account may share this email, fall back to a rebuild
+                for other, user_data in self._users.items():
+                    if other != username and user_data.get('email') == email:
+                        self._by_email[email] = other
+                        break
+
+    def load_all(self):
+        """Load all users"""
+        with self._lock:
+            self._refresh()
+            return {username: dict(data) for username, data in self._users.items()}
+
+    def save_all(self, users):
+        """Replace all users"""
+        with self._lock, file_lock(self.path):
+            self.store.save_all(users)
+            self._rebuild()
+
+    def get(self, username):
+        """Get a copy of a single user's data or None"""
+        with self._lock:
+            self._refresh()
+            user_data = self._users.get(username)
+            return dict(user_data) if user_data is not None else None
+
+    def put(self, username, user_data):
+        """Create or update a single user"""
+        # The file lock makes refresh-modify-persist atomic across workers
+        with self._lock, file_lock(self.path):
+            self._refresh()
+            self._unindex(username)
+            self._users[username] = dict(user_data)
+            email = user_data.get('email')
+            if email:
+                self._by_email.setdefault(email, username)
+            self._persist()
+
+    def delete(self, username):
+        """Delete a single user, returns False if it was not found"""
+        with self._lock, file_lock(self.path):
+            self._refresh()
+            if username not in self._users:
+                return False
+            self._unindex(username)
+            del self._users[username]
+            self._persist()
+            return True
+
+    def update_many(self, updates):
+        """Merge {username: {field: value}} into existing users in one write"""
+        with self._lock, file_lock(self.path):
+            self._refresh()
+            for username, fields in updates.items():
+                if username in self._users:
+                    self._users[username].update(fields)
+            self._persist()
+
+    def find_by_email(self, email):
+        """Get the username registered with email, or None"""
+        with self._lock:
+            self._refresh()
+            return self._by_email.get(email)
+
+
+class LogTokenStore:
+    """Verification and reset tokens kept in an append-only JSON Lines log
+
+    Each line of verification_tokens.jsonl is {"op": "put", "token": ...,
+    "data": {...}} or {"op": "del", "token": ...}, so issuing or using a
+    token appends one short line instead of rewriting every token. All live
+    tokens are held in memory, keyed by token, with a min-heap on expires_at
+    for purge_expired. The index is extended by reading only what other
+    processes appended since it was last used and rebuilt when compaction
+    replaces the file. A verification_tokens.json from before is imported
+    the first time the store is opened and kept as verification_tokens.json.bak.
+    """
+
+    def __init__(self, path):
+        self.legacy_path = path
+        self.path = os.path.splitext(path)[0] + '.jsonl'
+        self._lock = threading.RLock()
+        self._index = None
+        self._migrate()
+
+    def _migrate(self):
+        """Convert the old JSON token file into a log"""
+        if os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            return
+        with file_lock(self.path):
+            if os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+                return
+            self.save_all(JsonDocumentStore(self.legacy_path).load_all())
+            # Kept as a backup for rolling back to a version without the log
+            os.replace(self.legacy_path, f'{self.legacy_path}.bak')
+
+    def _refresh(self):
+        """Bring the in-memory index up to date with the log, caller holds _lock"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._index = {'ino': None, 'size': 0, 'tokens': {}, 'expiry': [], 'records': 0}
+            return self._index
+        index = self._index
+        if index is None or index['ino'] != st.st_ino or st.st_size < index['size']:
+            index = {'ino': st.st_ino, 'size': 0, 'tokens': {}, 'expiry': [], 'records': 0}
+        if st.st_size > index['size']:
+            offset = index['size']
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Still being written, pick it up next time
+                        break
+                    offset += len(line)
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    index['records'] += 1
+                    if record.get('op') == 'put':
+                        data = record['data']
+                        index['tokens'][record['token']] = data
+                        if data.get('expires_at'):
+                            heapq.heappush(index['expiry'], (data['expires_at'], record['token']))
+                    elif record.get('op') == 'del':
+                        index['tokens'].pop(record.get('token'), None)
+            index['size'] = offset
+        self._index = index
+        return index
+
+    def _append(self, records):
+        """Append records to the log with a single write, caller holds the file lock"""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(_dumps(record) + '\n' for record in records))
+
+    def _compact_if_needed(self):
+        """Rewrite the log once most of its records are dead, caller holds both locks"""
+        index = self._refresh()
+        records = index['records']
+        if records >= COMPACT_MIN_RECORDS and (records - len(index['tokens'])) / records >= COMPACT_DEAD_RATIO:
+            self.save_all(index['tokens'])
+
+    def load_all(self):
+        """Load all tokens"""
+        with self._lock:
+            return {token: dict(data) for token, data in self._refresh()['tokens'].items()}
+
+    def save_all(self, records):
+        """Replace all tokens by writing a fresh, compacted log"""
+        lines = [_dumps({'op': 'put', 'token': token, 'data': data}) for token, data in records.items()]
+        with self._lock, file_lock(self.path):
+            _replace_file(self.path, lines)
+            self._index = None
+
+    def get(self, token):
+        """Get a single token's data or None"""
+        with self._lock:
+            data = self._refresh()['tokens'].get(token)
+            return dict(data) if data is not None else None
+
+    def put(self, token, record):
+        """Insert or replace a single token"""
+        with self._lock, file_lock(self.path):
+            self._append([{'op': 'put', 'token': token, 'data': record}])
+
+    def delete(self, token):
+        """Delete a single token, returns False if it was not found"""
+        with self._lock, file_lock(self.path):
+            if token not in self._refresh()['tokens']:
+                return False
+            self._append([{'op': 'del', 'token': token}])
+            self._compact_if_needed()
+            return True
+
+    def update_many(self, updates):
+        """Merge {token: {field: value}} into existing tokens in one write"""
+        with self._lock, file_lock(self.path):
+            tokens = self._refresh()['tokens']
+            records = [{'op': 'put', 'token': token, 'data': dict(tokens[token], **fields)}
+                       for token, fields in updates.items() if token in tokens]
+            if records:
+                self._append(records)
+
+    def purge_expired(self, now):
+        """Delete every token whose expires_at (ISO timestamp) is at or before now
+
+        Returns the number of tokens removed.
+        """
+        with self._lock, file_lock(self.path):
+            index = self._refresh()
+            expired = []
+            while index['expiry'] and index['expiry'][0][0] <= now:
+                expires_at, token = heapq.heappop(index['expiry'])
+                data = index['tokens'].get(token)
+                # Skip heap entries left behind by deleted or re-issued tokens
+                if data is not None and data.get('expires_at') == expires_at:
+                    expired.append(token)
+            if expired:
+                try:
+                    self._append([{'op': 'del', 'token': token} for token in expired])
+                except Exception:
+                    # The popped heap entries are lost, rebuild from the log next time
+                    self._index = None
+                    raise
+                self._compact_if_needed()
+            return len(expired)
+
+
+class SQLiteDocumentStore:
+    """A dict of records kept as rows of one SQLite table
+
+    Subclasses name the table, its key column and any extra indexed columns
+    that are copied out of each record. The existing JSON file is imported
+    the first time the table is opened, and the import is recorded in the
+    meta table so a table emptied later is not filled from the file again.
+    """
+
+    table = None
+    key_column = None
+    extra_columns = ()
+
+    def __init__(self, path, db_path=None):
+        self.path = path
+        self.db = get_database(db_path)
+        self._migrate()
+
+    def _migrate(self):
+        """Import the JSON file once, if the table is still empty"""
+        marker = f'imported:{self.table}'
+        conn = self.db.connect()
+        if conn.execute('SELECT 1 FROM meta WHERE key = ?', (marker,)).fetchone():
+            return
+        with conn:
+            # Take the write lock first so only one worker imports
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('SELECT 1 FROM meta WHERE key = ?', (marker,)).fetchone():
+                return
+            empty = conn.execute(f'SELECT 1 FROM {self.table} LIMIT 1').fetchone() is None
+            if empty and os.path.exists(self.path):
+                for key, record in JsonDocumentStore(self.path).load_all().items():
+                    self._insert(conn, key, record)
+            conn.execute('INSERT INTO meta (key, value) VALUES (?, ?)', (marker, self.path))
+
+    def _row(self, key, record):
+        """Build the column values for a record"""
+        extras = tuple(record.get(column) for column in self.extra_columns)
+        return (key,) + extras + (_dumps(record),)
+
+    def _insert(self, conn, key, record):
+        """Insert or replace a single row"""
+        columns = (self.key_column,) + tuple(self.extra_columns) + ('data',)
+        placeholders = ', '.join('?' for _ in columns)
+        conn.execute(
+            f'INSERT OR REPLACE INTO {self.table} ({", ".join(columns)}) VALUES ({placeholders})',
+            self._row(key, record)
+        )
+
+    def load_all(self):
+        """Load all records"""
+        rows = self.db.connect().execute(
+            f'SELECT {self.key_column}, data FROM {self.table}'
+        ).fetchall()
+        return {key: json.loads(data) for key, data in rows}
+
+    def save_all(self, records):
+        """Replace all records"""
+        with self.db.connect() as conn:
+            conn.execute(f'DELETE FROM {self.table}')
+            for key, record in records.items():
+                self._insert(conn, key, record)
+
+    def get(self, key):
+        """Get a single record or None"""
+        row = self.db.connect().execute(
+            f'SELECT data FROM {self.table} WHERE {self.key_column} = ?', (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, record):
+        """Insert or replace a single record"""
+        with self.db.connect() as conn:
+            self._insert(conn, key, record)
+
+    def delete(self, key):
+        """Delete a single record, returns False if it was not found"""
+        with self.db.connect() as conn:
+            cursor = conn.execute(
+                f'DELETE FROM {self.table} WHERE {self.key_column} = ?', (key,)
+            )
+        return cursor.rowcount > 0
+
+    def update_many(self, updates):
+        """Merge {key: {field: value}} into existing records in one transaction
+
+        Only the given fields are set, in SQL, so a record rewritten by
+        another worker meanwhile (e.g. a new password hash) is not reverted.
+        """
+        with self.db.connect() as conn:
+            for key, fields in updates.items():
+                if not fields:
+                    continue
+                assignments = ['data = json_set(data' + ', ?, json(?)' * len(fields) + ')']
+                params = []
+                for field, value in fields.items():
+                    params += ['$."' + field.replace('"', '') + '"', _dumps(value)]
+                for field in self.extra_columns:
+                    if field in fields:
+                        assignments.append(f'{field} = ?')
+                        params.append(fields[field])
+                conn.execute(
+                    f'UPDATE {self.table} SET {", ".join(assignments)} WHERE {self.key_column} = ?',
+                    params + [key]
+                )
+
+
+class SQLiteUserStore(SQLiteDocumentStore):
+    """Users table with an index on email"""
+
+    table = 'users'
+    key_column = 'username'
+    extra_columns = ('email',)
+
+    def find_by_email(self, email):
+        """Get the username registered with email, or None"""
+        row = self.db.connect().execute(
+            'SELECT username FROM users WHERE email = ? LIMIT 1', (email,)
+        ).fetchone()
+        return row[0] if row else None
+
+
+class SQLiteTokenStore(SQLiteDocumentStore):
+    """Tokens table keyed by token"""
+
+    table = 'tokens'
+    key_column = 'token'
+    extra_columns = ('username', 'expires_at')
+
+    def purge_expired(self, now):
+        """Delete every token whose expires_at (ISO timestamp) is at or before now
+
+        Returns the number of tokens removed.
+        """
+        with self.db.connect() as conn:
+            cursor = conn.execute('DELETE FROM tokens WHERE expires_at <= ?', (now,))
+        return cursor.rowcount
+
+
+USER_BACKENDS = {
+    'json': JsonUserStore,
+    'sqlite': SQLiteUserStore,
+}
+
+TOKEN_BACKENDS = {
+    'json': LogTokenStore,
+    'sqlite': SQLiteTokenStore,
+}
+
+
+def create_user_store(users_file, backend=None):
+    """Create the user backend named by backend or STORAGE_BACKEND"""
+    name = backend or storage_backend_name()
+    if name not in USER_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name}")
+    store = USER_BACKENDS[name](users_file)
+    if name == 'json':
+        # SQLite already indexes username and email
+        store = UserDirectory(store)
+    return store
+
+
+def create_token_store(tokens_file, backend=None):
+    """Create the token backend named by backend or STORAGE_BACKEND"""
+    name = backend or storage_backend_name()
+    if name not in TOKEN_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name}")
+    return TOKEN_BACKENDS[name](tokens_file)
@@ -0,0 +1,52 @@
+"""Background purge of expired verification tokens and sessions
+
+Tokens used to disappear only when they were used or looked up after
+expiring, so tokens that were never clicked piled up forever. The sweeper
+calls a store's purge_expired once at start and then every interval
+seconds, which removes all expired records in one write. The same sweeper
+drops the server-side sessions of users who never came back.
+"""
+import threading
+import time
+from datetime import datetime
+
+from background import ProcessStarter
+
+
+class ExpirySweeper:
+    """Periodically purge expired records from a store with purge_expired(now)
+
+    interval: seconds between sweeps (0 disables the background thread)
+    """
+
+    def __init__(self, store, interval=600, name='expiry-sweeper'):
+        self.store = store
+        self.interval = interval
+        self.name = name
+        self.purged = 0
+        self._starter = ProcessStarter(self._start)
+
+    def sweep(self):
+        """Purge expired records now, returns how many were removed"""
+        purged = self.store.purge_expired(datetime.now().isoformat())
+        self.purged += purged
+        return purged
+
+    def ensure_started(self):
+        """Start the background sweeper in this process if it is not running"""
+        if self.interval:
+            self._starter.ensure()
+
+    def _start(self):
+        """Start the sweeper thread"""
+        thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        thread.start()
+
+    def _run(self):
+        """Sweep at start and then every interval seconds"""
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"{self.name} error: {e}")
+            time.sleep(self.interval)
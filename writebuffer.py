@@ -0,0 +1,292 @@
+"""Write-behind buffer for new journal entries
+
+Autosave posts a new entry every few seconds, and each post used to be a
+separate storage commit (journal, stats and search index). New entries
+are instead held per user for a short window and committed together, so
+a burst of N posts costs one commit. Reads flush the user's pending
+entries first, so they always see them.
+
+With a WAL directory every buffered entry is also appended (and fsynced)
+to this process's write-ahead log before the request returns. After each
+successful commit a "committed" record for those entries follows, so a
+replay skips them and never overwrites a later edit or brings back a
+deleted entry. The log is truncated once nothing is pending, and
+rewritten with just the uncommitted entries once it reaches
+WAL_COMPACT_RECORDS records. A process that finds the log of a dead
+process (its lock is free) replays it, so a crash loses nothing. Commits
+must be idempotent for that: a crash between a commit and its record
+replays an entry that was already stored, which just replaces it.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from background import ProcessStarter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Rewrite a busy process's WAL once it holds this many records
+WAL_COMPACT_RECORDS = 1000
+
+
+class WriteBuffer:
+    """Coalesce new entries per user and commit them in batches
+
+    commit(user_id, entries): stores entries (oldest first) in one go
+    window: seconds an entry may wait for others to join its batch
+    wal_dir: directory for write-ahead logs, None to keep entries only in memory
+    """
+
+    def __init__(self, commit, window=0.05, wal_dir=None):
+        self.commit = commit
+        self.window = window
+        self.wal_dir = wal_dir
+        self._pending = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._user_locks = {}
+        self._starter = ProcessStarter(self._start)
+        self._wal = None
+        self._wal_path = None
+        self._wal_records = 0
+        self.batches = 0
+        self.entries = 0
+        atexit.register(self.close)
+
+    def _user_lock(self, user_id):
+        """Serialize commits of one user within this process"""
+        with self._lock:
+            return self._user_locks.setdefault(user_id, threading.RLock())
+
+    def _ensure_started(self):
+        """Open this process's WAL, replay dead ones and start the flusher"""
+        self._starter.ensure()
+
+    def _start(self):
+        """Set up this process's buffer, log and flusher thread"""
+        with self._lock:
+            # Pending entries inherited from a parent process are its own
+            self._pending = {}
+            self._inflight = {}
+            self._user_locks = {}
+            if self.wal_dir:
+                os.makedirs(self.wal_dir, exist_ok=True)
+                self._wal_path = os.path.abspath(os.path.join(self.wal_dir, f'journal-{os.getpid()}.wal'))
+                self._wal = self._open_wal(self._wal_path)
+                self._wal_records = 0
+        if self.wal_dir:
+            self._recover()
+        thread = threading.Thread(target=self._run, name='journal-write-buffer', daemon=True)
+        thread.start()
+
+    def _open_wal(self, path):
+        """Open and lock a WAL for appending"""
+        wal = open(path, 'a+', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(wal.fileno(), fcntl.LOCK_EX)
+        return wal
+
+    def _recover(self):
+        """Commit the entries left in the logs of processes that died"""
+        own = self._wal_path
+        for path in glob.glob(os.path.join(self.wal_dir, 'journal-*.wal')):
+            if os.path.abspath(path) == own:
+                continue
+            try:
+                f = open(path, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            with f:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        # Its process is still running
+                        continue
+                try:
+                    if os.fstat(f.fileno()).st_ino != os.stat(path).st_ino:
+                        # Compacted by its (live) process since we opened it
+                        continue
+                except FileNotFoundError:
+                    continue
+                by_user = OrderedDict()
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    entries = by_user.setdefault(record['user_id'], OrderedDict())
+                    if 'discard' in record:
+                        entries.pop(record['discard'], None)
+                    elif 'committed' in record:
+                        for entry_id in record['committed']:
+                            entries.pop(entry_id, None)
+                    else:
+                        entries[record['entry'].get('id')] = record['entry']
+                try:
+                    for user_id, entries in by_user.items():
+                        if entries:
+                            with self._user_lock(user_id):
+                                self.commit(user_id, list(entries.values()))
+                except Exception as e:
+                    print(f"Write buffer recovery error for {path}: {e}")
+                    continue
+                os.remove(path)
+                if os.path.exists(f'{path}.tmp'):
+                    # Left by a compaction that crashed, the log above was still complete
+                    os.remove(f'{path}.tmp')
+
+    def _log(self, record):
+        """Append a record to the WAL and fsync it, caller holds _lock"""
+        if self._wal is not None:
+            self._wal.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._wal.flush()
+            os.fsync(self._wal.fileno())
+            self._wal_records += 1
+
+    def put(self, user_id, entry):
+        """Buffer a new entry for user"""
+        self._ensure_started()
+        with self._lock:
+            self._log({'user_id': user_id, 'entry': entry})
+            pending = self._pending.setdefault(user_id, {'entries': OrderedDict(), 'due': time.monotonic() + self.window})
+            pending['entries'][entry.get('id')] = entry
+            self._wakeup.notify()
+
+    def discard(self, user_id, entry_id):
+        """Drop a pending entry before it is stored, returns it or None"""
+        with self._lock:
+            pending = self._pending.get(user_id)
+            if pending is None or entry_id not in pending['entries']:
+                return None
+            entry = pending['entries'].pop(entry_id)
+            if not pending['entries']:
+                del self._pending[user_id]
+            # Recovery must not bring the entry back
+            self._log({'user_id': user_id, 'discard': entry_id})
+            self._truncate_wal()
+            return entry
+
+    def flush(self, user_id=None):
+        """Commit pending entries of one user (or of everyone) now"""
+        if user_id is None:
+            if not self._starter.active():
+                return
+            with self._lock:
+                user_ids = list(self._pending)
+            for pending_user in user_ids:
+                self.flush(pending_user)
+            return
+        # Reading a journal also recovers entries left by crashed processes
+        self._ensure_started()
+        with self._user_lock(user_id):
+            with self._lock:
+                pending = self._pending.pop(user_id, None)
+                if pending is None:
+                    return
+                token = object()
+                self._inflight[token] = (user_id, pending['entries'])
+            entries = list(pending['entries'].values())
+            try:
+                if entries:
+                    self.commit(user_id, entries)
+                    self.batches += 1
+                    self.entries += len(entries)
+                    with self._lock:
+                        # Ids buffered again meanwhile must still be replayed
+                        requeued = self._pending.get(user_id, {'entries': {}})['entries']
+                        committed = [entry_id for entry_id in pending['entries'] if entry_id not in requeued]
+                        self._log({'user_id': user_id, 'committed': committed})
+            except Exception:
+                # Keep the entries for the next attempt, ahead of newer ones
+                with self._lock:
+                    newer = self._pending.get(user_id, {'entries': OrderedDict()})['entries']
+                    pending['entries'].update(newer)
+                    self._pending[user_id] = pending
+                raise
+            finally:
+                with self._lock:
+                    del self._inflight[token]
+                    self._truncate_wal()
+
+    def _truncate_wal(self):
+        """Empty the WAL once every logged entry is committed, or compact a
+        long one, caller holds _lock"""
+        if self._wal is None:
+            return
+        if not self._pending and not self._inflight:
+            self._wal.truncate(0)
+            self._wal_records = 0
+        elif self._wal_records >= WAL_COMPACT_RECORDS:
+            self._compact_wal()
+
+    def _compact_wal(self):
+        """Replace the WAL with one holding only uncommitted entries, caller holds _lock
+
+        The new log is written and locked beside the old one and renamed
+        over it, so a crash leaves one complete log or the other.
+        """
+        tmp_path = f'{self._wal_path}.tmp'
+        wal = self._open_wal(tmp_path)
+        wal.truncate(0)
+        batches = [(user_id, entries) for user_id, entries in self._inflight.values()]
+        batches += [(user_id, pending['entries']) for user_id, pending in self._pending.items()]
+        records = 0
+        for user_id, entries in batches:
+            for entry in entries.values():
+                wal.write(json.dumps({'user_id': user_id, 'entry': entry}, ensure_ascii=False) + '\n')
+                records += 1
+        wal.flush()
+        os.fsync(wal.fileno())
+        os.replace(tmp_path, self._wal_path)
+        self._wal.close()
+        self._wal = wal
+        self._wal_records = records
+
+    def _run(self):
+        """Commit each user's entries once their window has passed"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                due = [user_id for user_id, pending in self._pending.items() if pending['due'] <= now]
+                if not due:
+                    next_due = min((pending['due'] for pending in self._pending.values()), default=None)
+                    self._wakeup.wait(None if next_due is None else next_due - now)
+                    continue
+            for user_id in due:
+                try:
+                    self.flush(user_id)
+                except Exception as e:
+                    print(f"Write buffer flush error: {e}")
+                    time.sleep(self.window)
+
+    def close(self):
+        """Commit everything and remove this process's WAL, run at exit"""
+        if not self._starter.active():
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            # The WAL is kept so the next process replays what is left
+            print(f"Write buffer flush error: {e}")
+            return
+        with self._lock:
+            if self._wal is not None and not self._pending:
+                if os.path.exists(self._wal_path):
+                    os.remove(self._wal_path)
+                self._wal.close()
+                self._wal = None
+
+    def stats(self):
+        """Get the number of commits and of entries they carried"""
+        with self._lock:
+            pending = sum(len(p['entries']) for p in self._pending.values())
+        return {'batches': self.batches, 'entries': self.entries, 'pending': pending}